@@ -0,0 +1,60 @@
+"""Add drinking_window_history
+
+Revision ID: 2e6c0f7d8a51
+Revises: 9d41f6a0b2e8
+Create Date: 2026-10-17 14:05:37.910264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6c0f7d8a51'
+down_revision: Union[str, None] = '9d41f6a0b2e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('drinking_window_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('window_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=False),
+    sa.Column('end_time', sa.Time(), nullable=False),
+    sa.Column('duration_hours', sa.Integer(), nullable=False),
+    sa.Column('repeat_pattern', sa.String(length=50), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('window_created_at', sa.DateTime(), nullable=False),
+    sa.Column('effective_from', sa.DateTime(), nullable=False),
+    sa.Column('effective_to', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_drinking_window_history_user_active_from', 'drinking_window_history', ['user_id', 'effective_from'],
+        unique=False, postgresql_where=sa.text('is_active'), sqlite_where=sa.text('is_active = 1')
+    )
+    op.create_index('ix_drinking_window_history_window_id', 'drinking_window_history', ['window_id'], unique=False)
+
+    # Earlier edits were overwritten in place, so each existing window gets a single
+    # version covering its lifetime as far as created_at/updated_at tell
+    op.execute("""
+        INSERT INTO drinking_window_history
+            (window_id, user_id, start_time, end_time, duration_hours, repeat_pattern,
+             is_active, window_created_at, effective_from, effective_to)
+        SELECT
+            id, user_id, start_time, end_time, duration_hours, repeat_pattern,
+            true, created_at, created_at,
+            CASE WHEN is_active THEN NULL ELSE updated_at END
+        FROM drinking_windows
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_drinking_window_history_window_id', table_name='drinking_window_history')
+    op.drop_index('ix_drinking_window_history_user_active_from', table_name='drinking_window_history')
+    op.drop_table('drinking_window_history')
@@ -0,0 +1,111 @@
+"""Partition drink_logs by month (Postgres)
+
+Revision ID: 4c8e1b7d9f20
+Revises: 7a3f9c2d1e64
+Create Date: 2026-10-17 20:05:37.918254
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8e1b7d9f20'
+down_revision: Union[str, None] = '7a3f9c2d1e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Months created past the current one; `python manage.py partitions` keeps this up afterwards
+MONTHS_AHEAD = 3
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        # Only Postgres partitions; elsewhere drink_logs stays a plain table
+        return
+
+    op.execute('ALTER TABLE drink_logs RENAME TO drink_logs_unpartitioned')
+    # The partition key has to be part of the primary key, so it can't be NULL.
+    # The app always sets it; rows from before that land on the epoch.
+    op.execute("UPDATE drink_logs_unpartitioned SET \"timestamp\" = 'epoch' WHERE \"timestamp\" IS NULL")
+    op.execute("""
+        CREATE TABLE drink_logs (
+            id integer NOT NULL DEFAULT nextval('drink_logs_id_seq'),
+            user_id integer NOT NULL REFERENCES users (id),
+            drink_type varchar NOT NULL,
+            quantity double precision NOT NULL,
+            "timestamp" timestamp without time zone NOT NULL,
+            logged_in_window boolean NOT NULL
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+
+    # One partition per month from the oldest drink to a few months ahead; the
+    # default partition takes anything outside them until a partition is made
+    oldest, newest = connection.execute(sa.text(
+        "SELECT min(\"timestamp\"), max(\"timestamp\") FROM drink_logs_unpartitioned WHERE \"timestamp\" > 'epoch'"
+    )).one()
+    now = datetime.utcnow()
+    month = (oldest or now).date().replace(day=1)
+    last = max(newest or now, now).date().replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        following = _next_month(month)
+        op.execute(
+            f"CREATE TABLE drink_logs_y{month.year}m{month.month:02d} PARTITION OF drink_logs "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        month = following
+    op.execute('CREATE TABLE drink_logs_default PARTITION OF drink_logs DEFAULT')
+
+    op.execute("""
+        INSERT INTO drink_logs (id, user_id, drink_type, quantity, "timestamp", logged_in_window)
+        SELECT id, user_id, drink_type, quantity, "timestamp", logged_in_window FROM drink_logs_unpartitioned
+    """)
+    # Hand the id sequence over before its old owner is dropped
+    op.execute('ALTER SEQUENCE drink_logs_id_seq OWNED BY drink_logs.id')
+    op.execute('DROP TABLE drink_logs_unpartitioned')
+
+    # Indexes are built after the load; each is created on every partition
+    op.execute('ALTER TABLE drink_logs ADD CONSTRAINT drink_logs_pkey PRIMARY KEY (id, "timestamp")')
+    op.create_index('ix_drink_logs_id', 'drink_logs', ['id'], unique=False)
+    op.create_index('ix_drink_logs_user_id_timestamp', 'drink_logs', ['user_id', 'timestamp'], unique=False)
+    op.execute('ANALYZE drink_logs')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # Only what is still attached comes back; archived partitions stay in their files
+    op.execute('ALTER TABLE drink_logs RENAME TO drink_logs_partitioned')
+    op.execute('ALTER TABLE drink_logs_partitioned RENAME CONSTRAINT drink_logs_pkey TO drink_logs_partitioned_pkey')
+    op.execute('ALTER INDEX ix_drink_logs_id RENAME TO ix_drink_logs_partitioned_id')
+    op.execute('ALTER INDEX ix_drink_logs_user_id_timestamp RENAME TO ix_drink_logs_partitioned_user_id_timestamp')
+    op.execute("""
+        CREATE TABLE drink_logs (
+            id integer NOT NULL DEFAULT nextval('drink_logs_id_seq'),
+            user_id integer NOT NULL REFERENCES users (id),
+            drink_type varchar NOT NULL,
+            quantity double precision NOT NULL,
+            "timestamp" timestamp without time zone,
+            logged_in_window boolean NOT NULL,
+            CONSTRAINT drink_logs_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO drink_logs (id, user_id, drink_type, quantity, "timestamp", logged_in_window)
+        SELECT id, user_id, drink_type, quantity, "timestamp", logged_in_window FROM drink_logs_partitioned
+    """)
+    op.execute('ALTER SEQUENCE drink_logs_id_seq OWNED BY drink_logs.id')
+    op.execute('DROP TABLE drink_logs_partitioned')
+    op.create_index('ix_drink_logs_id', 'drink_logs', ['id'], unique=False)
+    op.create_index('ix_drink_logs_user_id_timestamp', 'drink_logs', ['user_id', 'timestamp'], unique=False)
@@ -0,0 +1,51 @@
+"""Add drink_daily_rollups
+
+Revision ID: 5b7e2c91a4d3
+Revises: c1dd48ee6059
+Create Date: 2026-10-17 09:12:44.201837
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2c91a4d3'
+down_revision: Union[str, None] = 'c1dd48ee6059'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('drink_daily_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('in_window_count', sa.Integer(), nullable=False),
+    sa.Column('out_window_count', sa.Integer(), nullable=False),
+    sa.Column('in_window_quantity', sa.Float(), nullable=False),
+    sa.Column('out_window_quantity', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # Backfill from the existing log
+    op.execute("""
+        INSERT INTO drink_daily_rollups
+            (user_id, day, in_window_count, out_window_count, in_window_quantity, out_window_quantity)
+        SELECT
+            user_id,
+            date(timestamp),
+            SUM(CASE WHEN logged_in_window THEN 1 ELSE 0 END),
+            SUM(CASE WHEN logged_in_window THEN 0 ELSE 1 END),
+            SUM(CASE WHEN logged_in_window THEN quantity ELSE 0 END),
+            SUM(CASE WHEN logged_in_window THEN 0 ELSE quantity END)
+        FROM drink_logs
+        WHERE timestamp IS NOT NULL
+        GROUP BY user_id, date(timestamp)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('drink_daily_rollups')
@@ -0,0 +1,26 @@
+"""Add users.data_version
+
+Revision ID: 7a3f9c2d1e64
+Revises: 2e6c0f7d8a51
+Create Date: 2026-10-17 19:20:11.402871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3f9c2d1e64'
+down_revision: Union[str, None] = '2e6c0f7d8a51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('data_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'data_version')
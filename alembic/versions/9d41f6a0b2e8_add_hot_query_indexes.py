@@ -0,0 +1,42 @@
+"""Add indexes for hot queries and one active window per user
+
+Revision ID: 9d41f6a0b2e8
+Revises: 5b7e2c91a4d3
+Create Date: 2026-10-17 11:40:02.518320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d41f6a0b2e8'
+down_revision: Union[str, None] = '5b7e2c91a4d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_drink_logs_user_id_timestamp', 'drink_logs', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_drinking_windows_user_id_is_active', 'drinking_windows', ['user_id', 'is_active'], unique=False)
+
+    # Keep only the newest active window per user so the unique index can be built
+    op.execute("""
+        UPDATE drinking_windows SET is_active = false
+        WHERE is_active
+          AND id NOT IN (
+              SELECT MAX(id) FROM drinking_windows WHERE is_active GROUP BY user_id
+          )
+    """)
+    op.create_index(
+        'uq_drinking_windows_one_active_per_user', 'drinking_windows', ['user_id'], unique=True,
+        postgresql_where=sa.text('is_active'), sqlite_where=sa.text('is_active')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_drinking_windows_one_active_per_user', table_name='drinking_windows')
+    op.drop_index('ix_drinking_windows_user_id_is_active', table_name='drinking_windows')
+    op.drop_index('ix_drink_logs_user_id_timestamp', table_name='drink_logs')
@@ -0,0 +1,165 @@
+# benchmarks/events.py
+"""How many /events/stream connections one worker holds, and what they cost.
+
+    python -m benchmarks.seed --users 50 --drinks-per-user 100 --create-tables
+    python -m benchmarks.events --connections 5000 --writes 200 --idle-seconds 10
+
+Opens the streams against the app in-process (one event loop, as in a
+worker), spread over the benchmark users, then reports:
+
+- time to open them and resident memory per stream
+- CPU used while they sit idle (heartbeats, the version check)
+- delivery latency of drinks_logged events from the start of each POST /drinks/
+  to every stream of that user
+
+Sockets and kernel buffers aren't included: count a few KB more per stream behind a real server.
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import time
+
+import httpx
+
+from benchmarks.load import _percentile, load_bench_users
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Peak rather than current, where /proc isn't available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StreamClient:
+    """Drives one GET /events/stream through the ASGI interface and counts drinks_logged events."""
+
+    def __init__(self, app, user, headers=()):
+        self.app = app
+        self.user = user
+        self.headers = list(headers)
+        self.status = None
+        self.body = b""
+        self.received = 0
+        self.arrivals = []
+        self.changed = asyncio.Event()
+        self._disconnect = asyncio.Event()
+        self._requested = False
+
+    async def _receive(self):
+        if not self._requested:
+            self._requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.changed.set()
+        elif message["type"] == "http.response.body":
+            # Only the start is kept: enough to see the first events
+            if len(self.body) < 4096:
+                self.body += message.get("body", b"")
+                self.changed.set()
+            count = message.get("body", b"").count(b"event: drinks_logged")
+            if count:
+                self.received += count
+                self.arrivals.append(time.perf_counter())
+                self.changed.set()
+
+    def start(self):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/events/stream", "raw_path": b"/events/stream", "query_string": b"",
+            "root_path": "", "client": ("127.0.0.1", 0), "server": ("bench", 80),
+            "headers": [(b"host", b"bench"), (b"authorization", self.user.headers["Authorization"].encode())] + self.headers,
+        }
+        self.task = asyncio.ensure_future(self.app(scope, self._receive, self._send))
+
+    async def wait_for(self, predicate):
+        while not predicate():
+            self.changed.clear()
+            await self.changed.wait()
+
+    def disconnect(self):
+        self._disconnect.set()
+
+
+async def run(connections, writes, idle_seconds, users):
+    from main import app
+
+    ms = lambda seconds: round(seconds * 1000, 3)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        streams = []
+        for i in range(connections):
+            stream = StreamClient(app, users[i % len(users)])
+            stream.start()
+            streams.append(stream)
+            await stream.wait_for(lambda: stream.status is not None)
+        opened = time.perf_counter() - started
+        refused = sum(stream.status != 200 for stream in streams)
+        rss_after = _rss_mb()
+        print(f"opened {connections} streams in {opened:.2f} s ({refused} refused), "
+              f"{(rss_after - rss_before) * 1024 / connections:.1f} KB RSS per stream")
+
+        cpu = time.process_time()
+        await asyncio.sleep(idle_seconds)
+        if idle_seconds:
+            print(f"idle for {idle_seconds} s: {100 * (time.process_time() - cpu) / idle_seconds:.1f}% of a core")
+
+        by_user = {}
+        for stream in streams:
+            by_user.setdefault(stream.user.id, []).append(stream)
+        latencies, fan_out = [], []
+        for i in range(writes):
+            user = users[i % len(users)]
+            subscribers = by_user.get(user.id, [])
+            expected = [stream.received + 1 for stream in subscribers]
+            started = time.perf_counter()
+            await client.post("/drinks/", json={"drink_type": "beer", "quantity": 1.0}, headers=user.headers)
+            await asyncio.gather(*(
+                stream.wait_for(lambda stream=stream, count=count: stream.received >= count)
+                for stream, count in zip(subscribers, expected)
+            ))
+            arrivals = [stream.arrivals[-1] - started for stream in subscribers]
+            latencies.extend(arrivals)
+            fan_out.append(max(arrivals, default=0))
+
+        latencies.sort()
+        fan_out.sort()
+        print(f"{writes} writes, {connections // len(users)} streams per user: delivery p50 {ms(_percentile(latencies, 50))} ms  "
+              f"p99 {ms(_percentile(latencies, 99))} ms  last stream of a write p99 {ms(_percentile(fan_out, 99))} ms")
+
+        for stream in streams:
+            stream.disconnect()
+        await asyncio.gather(*(stream.task for stream in streams))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent event streams per worker")
+    parser.add_argument("--connections", type=int, default=1000, help="Streams to hold open")
+    parser.add_argument("--writes", type=int, default=100, help="POST /drinks/ requests to deliver")
+    parser.add_argument("--idle-seconds", type=float, default=5, help="Time to measure idle CPU over")
+    parser.add_argument("--users", type=int, default=50, help="Seeded benchmark users to spread streams over")
+    args = parser.parse_args(argv)
+
+    # The streams all come from here: lift the per-worker and per-user caps
+    os.environ.setdefault("EVENT_STREAM_MAX_CONNECTIONS", str(args.connections))
+    os.environ.setdefault("EVENT_STREAM_MAX_PER_USER", str(args.connections))
+    for name in ("AUTH_IP_RATE", "AUTH_EMAIL_RATE", "AUTH_GLOBAL_RATE"):
+        os.environ.setdefault(name, "0")
+
+    users = load_bench_users(args.users)
+    asyncio.run(run(args.connections, args.writes, args.idle_seconds, users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/group_commit.py
+"""POST /drinks/ committed per request vs through the group-commit writer.
+
+    python -m benchmarks.seed --users 50 --drinks-per-user 1000 --create-tables
+    python -m benchmarks.group_commit --requests 2000 --concurrency 64 --max-delay-ms 5
+
+Both modes run the same request mix against the same app; the only switch is
+drink_writer.drink_writer, which the route reads per request. Reports
+throughput, latency percentiles and the batches the writer committed.
+"""
+
+import argparse
+import asyncio
+import os
+
+import httpx
+
+import drink_writer
+from benchmarks.load import SCENARIOS, load_bench_users, run_scenario, _format_row
+from metrics import WRITE_BATCH_ROWS
+
+POST_DRINK = next((factory, prepare) for name, factory, prepare in SCENARIOS if name == "POST /drinks/")
+
+
+def _batches():
+    # (batches, rows) committed by the writer so far
+    series = WRITE_BATCH_ROWS._series.get(())
+    return (series[2], series[1]) if series else (0, 0.0)
+
+
+async def run(requests, concurrency, users, max_rows, max_delay_ms):
+    from main import app
+
+    factory, prepare = POST_DRINK
+    modes = [
+        ("per-request commit", None),
+        (f"group commit ({max_delay_ms} ms, {max_rows} rows)", drink_writer.GroupCommitWriter(max_rows, max_delay_ms)),
+    ]
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, writer in modes:
+            drink_writer.drink_writer = writer
+            batches_before, rows_before = _batches()
+            result = await run_scenario(client, users, factory, prepare, requests, concurrency)
+            if writer is not None:
+                await writer.close()
+            print(_format_row(name, result))
+            batches, rows = _batches()
+            if batches > batches_before:
+                batches -= batches_before
+                print(f"{'':38} {batches} batches, {(rows - rows_before) / batches:.1f} rows per batch")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-request and group commit for POST /drinks/")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight at once")
+    parser.add_argument("--users", type=int, default=50, help="Seeded benchmark users to spread requests over")
+    parser.add_argument("--max-rows", type=int, default=drink_writer.WRITE_BUFFER_MAX_ROWS)
+    parser.add_argument("--max-delay-ms", type=float, default=drink_writer.WRITE_BUFFER_MAX_DELAY_MS)
+    args = parser.parse_args(argv)
+
+    for name in ("AUTH_IP_RATE", "AUTH_EMAIL_RATE", "AUTH_GLOBAL_RATE"):
+        os.environ.setdefault(name, "0")
+
+    users = load_bench_users(args.users)
+    asyncio.run(run(args.requests, args.concurrency, users, args.max_rows, args.max_delay_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# benchmarks/load.py
+"""Drive every route through an in-process ASGI client and report latency percentiles.
+
+    python -m benchmarks.seed --users 200 --drinks-per-user 5000 --create-tables
+    python -m benchmarks.load --requests 2000 --concurrency 32 --compare benchmarks/results/previous.json
+
+Results are written as JSON (one file per run) so runs can be compared over time.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, time as dtime
+
+import httpx
+from sqlalchemy import select
+
+from benchmarks.seed import BENCH_PASSWORD, EMAIL_TEMPLATE
+from database import get_engine
+from dependencies import create_access_token
+from models import DrinkingWindow, User
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class BenchUser:
+    def __init__(self, id, email, window_id):
+        self.id = id
+        self.email = email
+        self.window_id = window_id
+        self.headers = {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+
+def load_bench_users(limit):
+    like = EMAIL_TEMPLATE.format("%")
+    with get_engine().connect() as connection:
+        rows = connection.execute(
+            select(User.id, User.email, DrinkingWindow.id)
+            .outerjoin(DrinkingWindow, (DrinkingWindow.user_id == User.id) & (DrinkingWindow.is_active == True))
+            .where(User.email.like(like))
+            .order_by(User.id)
+            .limit(limit)
+        ).all()
+    if not rows:
+        raise SystemExit("No benchmark users found, run `python -m benchmarks.seed` first")
+    return [BenchUser(user_id, email, window_id) for user_id, email, window_id in rows]
+
+
+# Each scenario is (name, request factory, optional prepare step). The factory gets
+# the client, a benchmark user and the prepared argument for that request.
+def _drink():
+    return {"drink_type": "beer", "quantity": 1.0, "timestamp": datetime.utcnow().isoformat()}
+
+async def _create_drinks(client, user, count):
+    r = await client.post("/drinks/batch", json=[_drink() for _ in range(count)], headers=user.headers)
+    return [d["id"] for d in r.json()["created"]]
+
+async def _create_windows(client, user, count):
+    ids = []
+    for _ in range(count):
+        r = await client.post("/drinking-windows/", json={
+            "start_time": dtime(20).isoformat(), "duration_hours": 2, "is_active": False
+        }, headers=user.headers)
+        ids.append(r.json()["id"])
+    return ids
+
+def _import_csv(i, rows=100):
+    # Distinct timestamps per request, so the import's duplicate check skips nothing
+    base = datetime.utcnow().timestamp() + i
+    lines = ["drink_type,quantity,timestamp"] + [
+        f"beer,1.0,{datetime.utcfromtimestamp(base + n / 1000).isoformat()}" for n in range(rows)
+    ]
+    return "\n".join(lines) + "\n"
+
+async def _first_event(client, user):
+    # StreamingResponse never ends, so drive the ASGI app directly: connect as a
+    # reconnecting client, which gets a resync event straight away, then hang up
+    from benchmarks.events import StreamClient
+    from main import app
+
+    stream = StreamClient(app, user, headers=[(b"last-event-id", b"0")])
+    stream.start()
+    try:
+        await stream.wait_for(lambda: stream.status is not None and (stream.status != 200 or b"event: " in stream.body))
+    finally:
+        stream.disconnect()
+        await stream.task
+    return httpx.Response(stream.status)
+
+SCENARIOS = [
+    ("GET /", lambda c, u, _: c.get("/"), None),
+    ("POST /auth/token", lambda c, u, _: c.post(
+        "/auth/token", data={"username": u.email, "password": BENCH_PASSWORD}), None),
+    ("POST /auth/register", lambda c, u, i: c.post(
+        "/auth/register", json={"email": f"bench-register-{time.time_ns()}-{i}@example.com", "password": BENCH_PASSWORD}
+    ), None),
+    ("GET /users/me", lambda c, u, _: c.get("/users/me", headers=u.headers), None),
+    ("GET /users/protected-endpoint", lambda c, u, _: c.get("/users/protected-endpoint", headers=u.headers), None),
+    ("POST /drinks/", lambda c, u, i: c.post("/drinks/", json=_drink(), headers=u.headers), None),
+    ("POST /drinks/batch (100)", lambda c, u, i: c.post(
+        "/drinks/batch", json=[_drink() for _ in range(100)], headers=u.headers), None),
+    ("GET /drinks/", lambda c, u, _: c.get("/drinks/", headers=u.headers), None),
+    ("GET /drinks/?limit=100", lambda c, u, _: c.get("/drinks/", params={"limit": 100}, headers=u.headers), None),
+    ("GET /drinks/?format=ndjson", lambda c, u, _: c.get(
+        "/drinks/", params={"format": "ndjson"}, headers=u.headers), None),
+    ("GET /drinks/export?format=csv", lambda c, u, _: c.get(
+        "/drinks/export", params={"format": "csv"}, headers=u.headers), None),
+    ("GET /drinks/export?format=ndjson", lambda c, u, _: c.get(
+        "/drinks/export", params={"format": "ndjson"}, headers=u.headers), None),
+    ("GET /drinks/weekly-usage", lambda c, u, _: c.get("/drinks/weekly-usage", headers=u.headers), None),
+    ("GET /drinks/summary", lambda c, u, _: c.get("/drinks/summary", headers=u.headers), None),
+    ("GET /drinks/stats", lambda c, u, _: c.get("/drinks/stats", headers=u.headers), None),
+    ("GET /drinks/stats?bucket=week", lambda c, u, _: c.get(
+        "/drinks/stats", params={"bucket": "week"}, headers=u.headers), None),
+    ("POST /drinks/import (100 csv rows)", lambda c, u, i: c.post(
+        "/drinks/import", content=_import_csv(i), headers={**u.headers, "Content-Type": "text/csv"}), None),
+    ("DELETE /drinks/{id}", lambda c, u, drink_id: c.delete(f"/drinks/{drink_id}", headers=u.headers),
+     _create_drinks),
+    ("GET /drinking-windows/", lambda c, u, _: c.get("/drinking-windows/", headers=u.headers), None),
+    ("GET /drinking-windows/weekly-usage", lambda c, u, _: c.get(
+        "/drinking-windows/weekly-usage", headers=u.headers), None),
+    ("POST /drinking-windows/", lambda c, u, _: c.post("/drinking-windows/", json={
+        "start_time": dtime(20).isoformat(), "duration_hours": 2, "is_active": False
+    }, headers=u.headers), None),
+    ("PUT /drinking-windows/{id}", lambda c, u, _: c.put(
+        f"/drinking-windows/{u.window_id}", json={"duration_hours": 3}, headers=u.headers), None),
+    ("DELETE /drinking-windows/{id}", lambda c, u, window_id: c.delete(
+        f"/drinking-windows/{window_id}", headers=u.headers), _create_windows),
+    ("GET /events/stream (first event)", lambda c, u, _: _first_event(c, u), None),
+]
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, users, factory, prepare, requests, concurrency):
+    # Spread requests round-robin over users; prepare per-request arguments up front
+    plan = [(users[i % len(users)], i) for i in range(requests)]
+    if prepare is not None:
+        per_user = {}
+        for user, _ in plan:
+            per_user[user.id] = per_user.get(user.id, 0) + 1
+        prepared = {}
+        for user in users:
+            if user.id in per_user:
+                prepared[user.id] = await prepare(client, user, per_user[user.id])
+        plan = [(user, prepared[user.id].pop()) for user, _ in plan]
+
+    latencies = []
+    errors = 0
+    queue = iter(plan)
+
+    async def worker():
+        nonlocal errors
+        for user, arg in queue:
+            started = time.perf_counter()
+            try:
+                response = await factory(client, user, arg)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(_percentile(latencies, 50)),
+            "p90": ms(_percentile(latencies, 90)),
+            "p99": ms(_percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+async def run(requests, concurrency, users, only=None):
+    from main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    # Start the app as a server would, so the first scenario hits a warmed-up worker
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, factory, prepare in SCENARIOS:
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = await run_scenario(client, users, factory, prepare, requests, concurrency)
+            print(_format_row(name, results[name]))
+    return results
+
+
+def _format_row(name, result, baseline=None):
+    latency = result["latency_ms"]
+    row = (f"{name:38} {result['throughput_rps']:>9} rps  p50 {latency['p50']:>8} ms  "
+           f"p99 {latency['p99']:>8} ms  errors {result['errors']}")
+    if baseline:
+        before = baseline["latency_ms"]["p99"]
+        if before:
+            row += f"  p99 {100 * (latency['p99'] - before) / before:+.1f}%"
+    return row
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every route in-process")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--users", type=int, default=50, help="Seeded benchmark users to spread requests over")
+    parser.add_argument("--only", nargs="*", help="Only run endpoints whose name contains one of these strings")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare p99 latency against")
+    args = parser.parse_args(argv)
+
+    # Every request comes from one client here: keep the auth throttle (rate_limit.py) out of it
+    for name in ("AUTH_IP_RATE", "AUTH_EMAIL_RATE", "AUTH_GLOBAL_RATE"):
+        os.environ.setdefault(name, "0")
+    # Nor the per-user event stream cap, with fewer users than requests in flight
+    os.environ.setdefault("EVENT_STREAM_MAX_PER_USER", str(args.concurrency))
+
+    users = load_bench_users(args.users)
+    results = asyncio.run(run(args.requests, args.concurrency, users, args.only))
+
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "database": get_engine().dialect.name,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": len(users),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(f"\nCompared with {args.compare}:")
+        for name, result in results.items():
+            print(_format_row(name, result, baseline.get(name)))
+
+
+if __name__ == "__main__":
+    main()
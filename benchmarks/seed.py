@@ -0,0 +1,135 @@
+# benchmarks/seed.py
+"""Synthetic data generator for benchmarks.
+
+    python -m benchmarks.seed --users 1000 --drinks-per-user 2000 --create-tables
+
+Rows are written with chunked multi-row Core inserts, so seeding millions of
+drink logs takes seconds to minutes instead of hours through the API.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import case, insert, null, select, true
+
+from database import SessionLocal, get_engine
+from hashing import get_password_hash
+from models import Base, DrinkingWindow, DrinkingWindowVersion, DrinkLog, User
+from rollups import rebuild_rollups
+from window_index import WindowIntervals
+
+EMAIL_TEMPLATE = "bench-user-{}@example.com"
+BENCH_PASSWORD = "benchmark"
+DRINK_TYPES = ["beer", "wine", "cider", "spirits", "cocktail"]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _window(user_id, rng, now, active):
+    start = dtime(rng.randrange(24), rng.choice((0, 30)))
+    duration = rng.randint(1, 6)
+    end = (datetime.combine(now.date(), start) + timedelta(hours=duration)).time()
+    created = now - timedelta(days=rng.randrange(1, 365))
+    return dict(
+        user_id=user_id, start_time=start, end_time=end, duration_hours=duration,
+        repeat_pattern="daily", is_active=active, created_at=created, updated_at=created
+    )
+
+
+def seed(users=100, windows_per_user=2, drinks_per_user=1000, days=365, chunk_size=10000,
+         random_seed=0, create_tables=False):
+    """Insert benchmark users with their windows and drink logs; returns row counts."""
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    if create_tables:
+        Base.metadata.create_all(get_engine())
+
+    password_hash = get_password_hash(BENCH_PASSWORD)
+    with get_engine().begin() as connection:
+        first = connection.execute(select(User.id).order_by(User.id.desc()).limit(1)).scalar() or 0
+        for chunk in _chunks(({
+            "email": EMAIL_TEMPLATE.format(first + i), "password_hash": password_hash,
+            "timezone": "UTC", "created_at": now, "updated_at": now
+        } for i in range(1, users + 1)), chunk_size):
+            connection.execute(insert(User), chunk)
+        user_ids = connection.execute(select(User.id).where(User.id > first)).scalars().all()
+
+        windows = {}
+        for user_id in user_ids:
+            # One active window per user, the rest are history
+            windows[user_id] = [_window(user_id, rng, now, active=(i == 0)) for i in range(windows_per_user)]
+        for chunk in _chunks((w for rows in windows.values() for w in rows), chunk_size):
+            connection.execute(insert(DrinkingWindow), chunk)
+        # One history version per window, as the routes would have written
+        connection.execute(insert(DrinkingWindowVersion).from_select(
+            ["window_id", "user_id", "start_time", "end_time", "duration_hours", "repeat_pattern",
+             "is_active", "window_created_at", "effective_from", "effective_to"],
+            select(
+                DrinkingWindow.id, DrinkingWindow.user_id, DrinkingWindow.start_time, DrinkingWindow.end_time,
+                DrinkingWindow.duration_hours, DrinkingWindow.repeat_pattern, true(),
+                DrinkingWindow.created_at, DrinkingWindow.created_at,
+                case((DrinkingWindow.is_active, null()), else_=DrinkingWindow.updated_at)
+            ).where(DrinkingWindow.user_id > first)
+        ))
+
+        def drinks():
+            for user_id in user_ids:
+                active = WindowIntervals(SimpleNamespace(**w) for w in windows[user_id] if w["is_active"])
+                for _ in range(drinks_per_user):
+                    timestamp = now - timedelta(seconds=rng.randrange(days * 86400))
+                    yield {
+                        "user_id": user_id, "drink_type": rng.choice(DRINK_TYPES),
+                        "quantity": rng.choice((0.5, 1.0, 1.0, 2.0)), "timestamp": timestamp,
+                        "logged_in_window": active.contains(timestamp)
+                    }
+        for chunk in _chunks(drinks(), chunk_size):
+            connection.execute(insert(DrinkLog), chunk)
+
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db)
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "users": len(user_ids),
+        "drinking_windows": len(user_ids) * windows_per_user,
+        "drink_logs": len(user_ids) * drinks_per_user,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the configured database with synthetic benchmark data")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--windows-per-user", type=int, default=2)
+    parser.add_argument("--drinks-per-user", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365, help="Spread drink timestamps over this many past days")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per multi-row INSERT")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible datasets")
+    parser.add_argument("--create-tables", action="store_true", help="Create missing tables first (fresh local databases)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    counts = seed(
+        users=args.users, windows_per_user=args.windows_per_user, drinks_per_user=args.drinks_per_user,
+        days=args.days, chunk_size=args.chunk_size, random_seed=args.seed, create_tables=args.create_tables
+    )
+    elapsed = time.perf_counter() - started
+    print(", ".join(f"{count} {table}" for table, count in counts.items()) + f" in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
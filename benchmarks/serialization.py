@@ -0,0 +1,84 @@
+# benchmarks/serialization.py
+"""Per-row cost of loading and serializing drink logs for the list endpoints.
+
+    python -m benchmarks.seed --users 10 --drinks-per-user 20000 --create-tables
+    python -m benchmarks.serialization --rows 5000 --repeat 20
+
+Compares the old path (ORM objects validated through DrinkLogOut, stdlib json),
+one TypeAdapter validating and dumping the whole list, and the column-tuple
+path the routes use now (RowsResponse, no per-row validation).
+"""
+
+import argparse
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from models import DrinkLog
+from routers.drinks import DRINK_LOG_COLUMNS, DRINK_LOG_FIELDS
+from schemas import DrinkLogOut
+from serialization import RowsResponse, orjson
+
+DRINK_LOGS_ADAPTER = TypeAdapter(List[DrinkLogOut])
+
+
+def orm_response_model(db, user_id, rows):
+    logs = db.execute(select(DrinkLog).where(DrinkLog.user_id == user_id).limit(rows)).scalars().all()
+    validated = [DrinkLogOut.model_validate(log, from_attributes=True) for log in logs]
+    return JSONResponse(jsonable_encoder(validated)).body
+
+def tuples_type_adapter(db, user_id, rows):
+    result = db.execute(select(*DRINK_LOG_COLUMNS).where(DrinkLog.user_id == user_id).limit(rows)).all()
+    content = [dict(zip(DRINK_LOG_FIELDS, row)) for row in result]
+    return DRINK_LOGS_ADAPTER.dump_json(DRINK_LOGS_ADAPTER.validate_python(content))
+
+def tuples_rows_response(db, user_id, rows):
+    result = db.execute(select(*DRINK_LOG_COLUMNS).where(DrinkLog.user_id == user_id).limit(rows)).all()
+    return RowsResponse(DRINK_LOG_FIELDS, result).body
+
+PATHS = [
+    ("ORM + response_model + json", orm_response_model),
+    ("tuples + TypeAdapter", tuples_type_adapter),
+    ("tuples + RowsResponse", tuples_rows_response),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-row serialization cost of GET /drinks/")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows per response")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per path; the best one is reported")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        user_id, available = db.execute(
+            select(DrinkLog.user_id, func.count()).group_by(DrinkLog.user_id).order_by(func.count().desc()).limit(1)
+        ).first() or (None, 0)
+        if not available:
+            raise SystemExit("No drink logs found, run `python -m benchmarks.seed` first")
+        rows = min(args.rows, available)
+        print(f"{rows} rows per response, best of {args.repeat}, orjson {'on' if orjson else 'off'}")
+
+        baseline = None
+        for name, path in PATHS:
+            best = float("inf")
+            for _ in range(args.repeat):
+                # Fresh identity map each run so ORM loading is measured too
+                db.expunge_all()
+                started = time.perf_counter()
+                body = path(db, user_id, rows)
+                best = min(best, time.perf_counter() - started)
+            per_row = best / rows * 1e6
+            baseline = baseline or per_row
+            print(f"{name:30} {best * 1000:9.2f} ms  {per_row:7.2f} us/row  x{baseline / per_row:.1f}  {len(body)} bytes")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
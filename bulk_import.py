@@ -0,0 +1,215 @@
+# bulk_import.py
+"""Bulk import of historical drink logs from CSV or NDJSON.
+
+The input is parsed line by line, validated against DrinkLogCreate and
+classified against the user's window history (the window version in effect
+at each drink's timestamp, as reclassify does). Rows are loaded IMPORT_CHUNK_SIZE
+at a time, one transaction per chunk: through COPY into a staging table on
+Postgres/psycopg2, with executemany elsewhere. Rows already stored with the
+same (user_id, timestamp, drink_type), or repeated in the input, are skipped,
+so an interrupted import can simply be run again.
+"""
+
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import anyio
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+
+from data_versions import bump_data_version
+from models import DrinkingWindowVersion, DrinkLog
+from rollups import apply_drink_deltas
+from schemas import DrinkLogCreate
+from timestamps import naive_utc
+from window_history import WindowTimeline
+
+IMPORT_CHUNK_SIZE = 10_000
+
+# Errors beyond this are only counted, so a bad file cannot blow up the report
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_COLUMNS = ("user_id", "drink_type", "quantity", "timestamp", "logged_in_window")
+
+
+def load_timeline(db, user_id):
+    versions = db.execute(select(DrinkingWindowVersion).where(
+        DrinkingWindowVersion.user_id == user_id,
+        DrinkingWindowVersion.is_active == True
+    )).scalars().all()
+    return WindowTimeline(versions)
+
+
+def iter_records(stream, format):
+    """(line number, record dict or None, parse error or None) for each input record."""
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Empty cells mean "not given", e.g. a blank timestamp defaults to now
+            yield reader.line_num, {k: v for k, v in record.items() if v not in ("", None)}, None
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+def _copy_rows(db, rows):
+    # COPY the chunk into a temporary staging table, then move over whatever is not stored yet
+    connection = db.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS drink_logs_import "
+        "(LIKE drink_logs INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (row["user_id"], row["drink_type"], row["quantity"], row["timestamp"].isoformat(),
+         "t" if row["logged_in_window"] else "f")
+        for row in rows
+    )
+    buffer.seek(0)
+    columns = ", ".join(IMPORT_COLUMNS)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY drink_logs_import ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return connection.exec_driver_sql(f"""
+        INSERT INTO drink_logs ({columns})
+        SELECT {columns} FROM drink_logs_import AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM drink_logs AS d
+            WHERE d.user_id = s.user_id AND d.timestamp = s.timestamp AND d.drink_type = s.drink_type
+        )
+        RETURNING timestamp, quantity, logged_in_window
+    """).all()
+
+
+def _executemany_rows(db, user_id, rows):
+    # Look up the keys already stored in the chunk's time range, then insert the rest
+    existing = set(db.execute(select(DrinkLog.timestamp, DrinkLog.drink_type).where(
+        DrinkLog.user_id == user_id,
+        DrinkLog.timestamp >= min(row["timestamp"] for row in rows),
+        DrinkLog.timestamp <= max(row["timestamp"] for row in rows),
+    )).all())
+    rows = [row for row in rows if (row["timestamp"], row["drink_type"]) not in existing]
+    if rows:
+        db.execute(insert(DrinkLog.__table__), rows)
+    return [SimpleNamespace(**row) for row in rows]
+
+
+def _supports_copy(db):
+    dialect = db.bind.dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def load_chunk(db, user_id, rows):
+    """Insert a chunk of new rows in one transaction; returns how many were not duplicates."""
+    inserted = _copy_rows(db, rows) if _supports_copy(db) else _executemany_rows(db, user_id, rows)
+    if inserted:
+        apply_drink_deltas(db, user_id, inserted)
+        db.execute(bump_data_version(user_id))
+    db.commit()
+    return len(inserted)
+
+
+class RequestBodyReader(io.RawIOBase):
+    """Blocking, read-only file over an ASGI request body.
+
+    Lets the importer parse an upload incrementally from a worker thread;
+    each read waits on the event loop for the next body chunk.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    async def _next_chunk(self):
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = anyio.from_thread.run(self._next_chunk)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def import_drink_logs(db, user_id, stream, format, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Import drink logs from a text stream of CSV (with a header row) or NDJSON.
+
+    `progress(report)` is called after every committed chunk. Returns the
+    report: rows received, imported, skipped as duplicates, rejected (with
+    the first MAX_REPORTED_ERRORS errors by line) and rows per second.
+    """
+    started = time.perf_counter()
+    timeline = load_timeline(db, user_id)
+    now = datetime.utcnow()
+    report = {"received": 0, "imported": 0, "duplicates": 0, "rejected": 0, "errors": []}
+    chunk, seen = [], set()
+
+    def flush():
+        if chunk:
+            imported = load_chunk(db, user_id, chunk)
+            report["imported"] += imported
+            report["duplicates"] += len(chunk) - imported
+        elapsed = time.perf_counter() - started
+        report["seconds"] = round(elapsed, 3)
+        report["rows_per_second"] = round(report["received"] / elapsed, 1) if elapsed else None
+        chunk.clear()
+        seen.clear()
+        if progress is not None:
+            progress(report)
+
+    for line, record, error in iter_records(stream, format):
+        report["received"] += 1
+        if error is None:
+            try:
+                drink_log = DrinkLogCreate(**record)
+            except ValidationError as e:
+                error = e.errors(include_url=False, include_context=False)
+        if error is not None:
+            report["rejected"] += 1
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append({"line": line, "detail": error})
+            continue
+
+        timestamp = naive_utc(drink_log.timestamp) if drink_log.timestamp else now
+        key = (timestamp, drink_log.drink_type)
+        if key in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(key)
+        chunk.append({
+            "user_id": user_id,
+            "drink_type": drink_log.drink_type,
+            "quantity": drink_log.quantity,
+            "timestamp": timestamp,
+            "logged_in_window": timeline.contains(timestamp),
+        })
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return report
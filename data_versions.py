@@ -0,0 +1,68 @@
+# data_versions.py
+"""Per-user data versions for conditional GETs.
+
+Every route that changes a user's drinks or windows bumps users.data_version
+in the same transaction. Read routes tag their response with it as an ETag
+and answer a matching If-None-Match with 304 after a single primary-key
+lookup, before any row query or serialization.
+"""
+
+from fastapi import Request, Response
+from sqlalchemy import select, update
+
+from database import mark_recent_write
+from models import User
+
+# Clients may reuse a response only after revalidating it, and shared caches must not keep it
+CACHE_CONTROL = "private, no-cache"
+
+
+def _bump():
+    return update(User).values(
+        data_version=User.data_version + 1,
+        # A data change is not a profile change: keep updated_at's onupdate out of it
+        updated_at=User.updated_at,
+    ).execution_options(synchronize_session=False)
+
+
+def bump_data_version(user_id=None):
+    """UPDATE statement incrementing one user's data version (everyone's if user_id is None)."""
+    if user_id is None:
+        return _bump()
+    # Every write path comes through here: pin the user's reads to the primary for a while
+    mark_recent_write(user_id)
+    return _bump().where(User.id == user_id)
+
+
+def bump_data_versions(user_ids):
+    """Like bump_data_version, for several users in one statement."""
+    for user_id in user_ids:
+        mark_recent_write(user_id)
+    return _bump().where(User.id.in_(user_ids))
+
+
+async def data_etag(db, user_id: int) -> str:
+    # Read the version before the data: a write landing in between leaves the
+    # response tagged with the older version, so clients refetch next time
+    version = (await db.execute(select(User.data_version).where(User.id == user_id))).scalar()
+    return f'"{user_id}.{version}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(request: Request, etag: str):
+    """A 304 response if the client already has this version, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return None
@@ -1,17 +1,187 @@
-from sqlalchemy import create_engine
+import asyncio
+import threading
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import CursorResult, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
 import os
+import time
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from metrics import READ_SESSIONS, REPLICA_LAG, TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
+
 # Load environment variables from .env file
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL_ALCHEMY')
 
-engine = create_engine(DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() not in ('0', 'false', 'no')
+
+
+# Routers talk to the database through an AsyncSession. Set DATABASE_ASYNC=0 to
+# run them on the sync engine instead, with each call pushed to the threadpool.
+DATABASE_ASYNC = _env_flag('DATABASE_ASYNC', '1')
+
+# Pool settings apply to every engine; each worker process has its own pools,
+# so size them as (database max_connections / workers / engines)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+DB_POOL_PRE_PING = _env_flag('DB_POOL_PRE_PING', '0')
+# Server-side statement timeout in milliseconds (Postgres only, 0 disables it)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+
+# Optional read replica for the GET routes (see dependencies.get_read_db). Reads
+# go back to the primary while the replica lags more than REPLICA_MAX_LAG_SECONDS
+# or is unreachable, and for READ_YOUR_WRITES_SECONDS after a user's own write.
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL_ALCHEMY')
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '2'))
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '10'))
+# A lag probe that hasn't answered after this long counts as an unreachable replica
+REPLICA_CHECK_TIMEOUT_SECONDS = float(os.getenv('REPLICA_CHECK_TIMEOUT_SECONDS', '1'))
+
+# Async drivers for the sync URLs we are configured with
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def _async_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def _engine_options(url, is_async):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite keeps its own pool choice. Sync sessions hop between threadpool threads
+        # (SyncSessionAdapter, BackgroundTasks) but are used by one caller at a time.
+        return {} if is_async else {'connect_args': {'check_same_thread': False}}
+    # Same QueuePool as the default, plus checkout-wait timing
+    options = {
+        'poolclass': TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.get_backend_name() == 'postgresql':
+        if url.get_driver_name() == 'asyncpg':
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    return options
+
+
+def _create_engines(url, async_url=None):
+    """Sync engine for `url`, plus the async one when DATABASE_ASYNC is on."""
+    sync_engine = create_engine(url, **_engine_options(url, is_async=False))
+    instrument_engine(sync_engine)
+    if not DATABASE_ASYNC:
+        return sync_engine, None
+
+    async_url = async_url or _async_url(url)
+    async_engine = create_async_engine(async_url, **_engine_options(async_url, is_async=True))
+    instrument_engine(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker that creates the engines (see init_engines) before its first session."""
+
+    def __call__(self, **local_kw):
+        init_engines()
+        return super().__call__(**local_kw)
+
+
+def _sessionmakers():
+    sessions = _LazySessionmaker(autocommit=False, autoflush=False)
+    if not DATABASE_ASYNC:
+        return sessions, None
+    # Objects must stay readable after commit: an expired attribute would need IO to reload
+    return sessions, _LazySessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# Engines are created by init_engines(), at app startup or on the first session,
+# so importing this module (and everything that imports it) stays cheap
+engine = async_engine = read_engine = async_read_engine = None
+_engines_lock = threading.Lock()
+
+SessionLocal, AsyncSessionLocal = _sessionmakers()
+if DATABASE_READ_URL:
+    ReadSessionLocal, AsyncReadSessionLocal = _sessionmakers()
+else:
+    ReadSessionLocal, AsyncReadSessionLocal = SessionLocal, AsyncSessionLocal
+
+
+def init_engines():
+    """Create the engines and bind the sessionmakers to them; later calls do nothing."""
+    global engine, async_engine, read_engine, async_read_engine
+    with _engines_lock:
+        if engine is not None:
+            return
+        primary, async_primary = _create_engines(DATABASE_URL, os.getenv('DATABASE_URL_ASYNC'))
+        if DATABASE_READ_URL:
+            replica, async_replica = _create_engines(DATABASE_READ_URL, os.getenv('DATABASE_READ_URL_ASYNC'))
+        else:
+            replica, async_replica = primary, async_primary
+
+        SessionLocal.configure(bind=primary)
+        ReadSessionLocal.configure(bind=replica)
+        if DATABASE_ASYNC:
+            AsyncSessionLocal.configure(bind=async_primary)
+            AsyncReadSessionLocal.configure(bind=async_replica)
+        async_engine, read_engine, async_read_engine = async_primary, replica, async_replica
+        # Set last: `engine is not None` means everything above is in place
+        engine = primary
+
+
+def get_engine():
+    """The primary sync engine, for scripts and maintenance commands."""
+    init_engines()
+    return engine
+
+
+def _open_connections(sync_engine, count):
+    with ExitStack() as stack:
+        for connection in [stack.enter_context(sync_engine.connect()) for _ in range(count)]:
+            connection.exec_driver_sql('SELECT 1')
+
+
+async def _open_async_connections(engine, count):
+    async with AsyncExitStack() as stack:
+        connections = await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(count)))
+        for connection in connections:
+            await connection.exec_driver_sql('SELECT 1')
+
+
+async def warm_pools(connections=DB_POOL_SIZE):
+    """Open `connections` connections at once in each pool the routers use.
+
+    They go back to the pool idle, so the first requests after startup skip
+    connecting (TCP, TLS, auth) to the database.
+    """
+    init_engines()
+    if connections <= 0:
+        return
+    engines = {async_engine, async_read_engine} if DATABASE_ASYNC else {engine, read_engine}
+    for pool_engine in engines:
+        if DATABASE_ASYNC:
+            await _open_async_connections(pool_engine, connections)
+        else:
+            await run_in_threadpool(_open_connections, pool_engine, connections)
+
 
 Base = declarative_base()
 
@@ -21,4 +191,157 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+class SyncSessionAdapter:
+    """The awaitable subset of AsyncSession the routers use, backed by a sync Session.
+
+    Each call runs in the threadpool, so handlers keep the same code whether
+    or not DATABASE_ASYNC is enabled.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        def execute():
+            result = self.sync_session.execute(statement, params, **kwargs)
+            if isinstance(result, CursorResult) and not result.returns_rows:
+                return result
+            # Buffer rows here, so consuming the result never touches the connection
+            return result.freeze()()
+        return await run_in_threadpool(execute)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self.sync_session.get, entity, ident)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+@asynccontextmanager
+async def _session_scope(async_sessions, sync_sessions):
+    if async_sessions is not None:
+        async with async_sessions() as db:
+            yield db
+        return
+
+    db = sync_sessions(expire_on_commit=False)
+    try:
+        yield SyncSessionAdapter(db)
+    finally:
+        await run_in_threadpool(db.close)
+
+
+# Dependency to get a session for async handlers
+async def get_async_db():
+    async with _session_scope(AsyncSessionLocal, SessionLocal) as db:
+        yield db
+
+
+def write_session():
+    """Session on the primary for work outside a request handler, like get_async_db's."""
+    return _session_scope(AsyncSessionLocal, SessionLocal)
+
+
+# Replica health, refreshed at most every REPLICA_LAG_CHECK_SECONDS per process
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_replica_state = {'checked_at': float('-inf'), 'usable': True, 'probe': None}
+_recent_writers = TTLCache(maxsize=100_000, ttl=READ_YOUR_WRITES_SECONDS)
+
+
+def replica_lag_seconds():
+    init_engines()
+    with read_engine.connect() as connection:
+        if read_engine.dialect.name != 'postgresql':
+            connection.exec_driver_sql('SELECT 1')
+            return 0.0
+        return float(connection.execute(REPLICA_LAG_SQL).scalar())
+
+
+async def replica_usable():
+    if not DATABASE_READ_URL:
+        return False
+    now = time.monotonic()
+    if now - _replica_state['checked_at'] >= REPLICA_LAG_CHECK_SECONDS:
+        _replica_state['checked_at'] = now
+        probe = _replica_state['probe']
+        if probe is not None and not probe.done() and probe.get_loop() is asyncio.get_running_loop():
+            # The last probe is still hanging (e.g. a paused replica): don't make this request wait too
+            lag = None
+        else:
+            probe = _replica_state['probe'] = asyncio.ensure_future(run_in_threadpool(replica_lag_seconds))
+            probe.add_done_callback(lambda f: f.cancelled() or f.exception())
+            try:
+                # Shielded: a timed-out probe keeps its thread until the driver gives up
+                lag = await asyncio.wait_for(asyncio.shield(probe), REPLICA_CHECK_TIMEOUT_SECONDS)
+            except (SQLAlchemyError, asyncio.TimeoutError):
+                lag = None
+        if lag is None:
+            REPLICA_LAG.set(float('inf'))
+            _replica_state['usable'] = False
+        else:
+            REPLICA_LAG.set(lag)
+            _replica_state['usable'] = lag <= REPLICA_MAX_LAG_SECONDS
+    return _replica_state['usable']
+
+
+def mark_recent_write(user_id: int):
+    """Keep this user's reads on the primary for READ_YOUR_WRITES_SECONDS."""
+    if DATABASE_READ_URL:
+        _recent_writers.set(user_id, True)
+
+
+def wrote_recently(user_id: int) -> bool:
+    return _recent_writers.get(user_id) is not None
+
+
+@asynccontextmanager
+async def read_session(use_primary=False):
+    """Session on the read replica when it is configured and healthy, else on the primary."""
+    if not use_primary and await replica_usable():
+        READ_SESSIONS.inc(1, 'replica')
+        async with _session_scope(AsyncReadSessionLocal, ReadSessionLocal) as db:
+            yield db
+        return
+    READ_SESSIONS.inc(1, 'primary')
+    async with _session_scope(AsyncSessionLocal, SessionLocal) as db:
+        yield db
+
+
+def sync_sessionmaker(db):
+    """The sync sessionmaker for the database `db` is bound to, for work that outlives the request."""
+    return ReadSessionLocal if db.bind in (read_engine, async_read_engine) else SessionLocal
@@ -1,13 +1,16 @@
-from passlib.context import CryptContext
-from jose import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
 
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import time
 
-from database import SessionLocal, get_db
+from cache import TTLCache
+from database import get_async_db, read_session, wrote_recently
+from hashing import get_password_hash, verify_password, verify_and_update, hashing_pool
 from models import User
 from schemas import TokenData
 import os
@@ -16,23 +19,71 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Authenticated principals cached per bearer token, so steady-state traffic skips the users lookup
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+principal_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Read-only snapshot of the authenticated user, detached from any session."""
+    id: int
+    email: str
+    timezone: str
+    created_at: datetime
+
+    @classmethod
+    def from_user(cls, user: User):
+        return cls(id=user.id, email=user.email, timezone=user.timezone, created_at=user.created_at)
+
+
+def user_timezone(user):
+    """The user's configured timezone, falling back to UTC if it is missing or unknown."""
+    try:
+        return ZoneInfo(user.timezone or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def invalidate_user(user_id: int):
+    """Drop cached principals for a user; call whenever the user record changes."""
+    principal_cache.discard_where(lambda principal: principal.id == user_id)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
+    if not user:
+        return None
+    valid, new_hash = await hashing_pool.run(verify_and_update, password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        # Stored hash predates the current bcrypt cost, upgrade it while we have the password
+        user.password_hash = new_hash
+        await db.commit()
     return user
 
+def load_jose():
+    # python-jose pulls in its crypto backends on import; the app imports it at
+    # startup (see main.warm_up), scripts on their first token
+    from jose import JWTError, jwt
+    return JWTError, jwt
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    _, jwt = load_jose()
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
@@ -40,11 +91,16 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 
 async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
 ):
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=401, detail="Could not validate credentials"
     )
+    JWTError, jwt = load_jose()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -53,7 +109,21 @@ async def get_current_user(
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = await get_user_by_email(db, token_data.email)
     if user is None:
         raise credentials_exception
-    return user
+
+    # Never cache past the token's own expiry
+    principal = Principal.from_user(user)
+    principal_cache.set(token, principal, ttl=payload["exp"] - time.time())
+    return principal
+
+
+async def get_read_db(current_user=Depends(get_current_user)):
+    """Session for read-only routes, on the read replica when one is configured.
+
+    Falls back to the primary while the replica lags or is down, and for a
+    user who wrote recently, so they always see their own changes.
+    """
+    async with read_session(use_primary=wrote_recently(current_user.id)) as db:
+        yield db
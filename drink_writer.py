@@ -0,0 +1,188 @@
+# drink_writer.py
+"""Writing drink logs: the multi-row insert the routes share, and optional group commit.
+
+With DRINK_WRITE_BUFFER=1, POST /drinks/ hands its row to a GroupCommitWriter
+instead of committing on its own. A single flusher task per worker collects
+rows for up to WRITE_BUFFER_MAX_DELAY_MS, or until WRITE_BUFFER_MAX_ROWS are
+waiting, and writes them in one transaction: one INSERT, the rollup deltas
+and the data version bumps, then one commit (one WAL flush). Each request is
+answered only after the commit of its batch, so an acknowledged drink is as
+durable as before; the price is up to the delay in extra latency per write.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import insert
+
+from data_versions import bump_data_versions
+from database import write_session
+from events import publish_drinks_logged
+from metrics import WRITE_BATCH_ROWS, WRITE_FLUSH_SECONDS, WRITE_WAIT_SECONDS
+from models import DrinkLog
+from rollups import apply_drink_deltas
+
+WRITE_BUFFER_ENABLED = os.getenv("DRINK_WRITE_BUFFER", "0").lower() not in ("0", "false", "no")
+WRITE_BUFFER_MAX_ROWS = int(os.getenv("WRITE_BUFFER_MAX_ROWS", "500"))
+WRITE_BUFFER_MAX_DELAY_MS = float(os.getenv("WRITE_BUFFER_MAX_DELAY_MS", "5"))
+
+
+async def insert_drink_logs(db, rows):
+    """Insert drink rows (dicts of DrinkLog columns) in the session's transaction.
+
+    Returns the new rows, with their ids, as DrinkLogOut-shaped dicts and as
+    objects apply_drink_deltas accepts.
+    """
+    table = DrinkLog.__table__
+    if db.bind.dialect.full_returning:
+        # One round trip: multi-row VALUES with the generated columns returned
+        result = await db.execute(insert(table).values(rows).returning(*table.c))
+        new_drinks = result.all()
+        return [dict(row._mapping) for row in new_drinks], new_drinks
+    # Dialects without INSERT .. RETURNING (e.g. SQLite): flush the rows and read back the ids
+    new_drinks = [DrinkLog(**row) for row in rows]
+    db.add_all(new_drinks)
+    await db.flush()
+    return [dict(row, id=drink.id) for row, drink in zip(rows, new_drinks)], new_drinks
+
+
+async def commit_drink_logs(db, rows):
+    """Insert rows of any number of users, update their rollups and data versions, and commit."""
+    created, new_drinks = await insert_drink_logs(db, rows)
+    by_user = defaultdict(list)
+    for drink in new_drinks:
+        by_user[drink.user_id].append(drink)
+    for user_id, drinks in by_user.items():
+        await db.run_sync(apply_drink_deltas, user_id, drinks)
+    await db.execute(bump_data_versions(list(by_user)))
+    await db.commit()
+    return created
+
+
+def _content(row):
+    return row["user_id"], row["timestamp"], row["drink_type"], row["quantity"], row["logged_in_window"]
+
+
+def _fail(items, error):
+    for _, future, _ in items:
+        if not future.done():
+            future.set_exception(error)
+
+
+class GroupCommitWriter:
+    """Commits drink rows submitted by concurrent requests in shared transactions."""
+
+    def __init__(self, max_rows=WRITE_BUFFER_MAX_ROWS, max_delay_ms=WRITE_BUFFER_MAX_DELAY_MS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._loop = None
+
+    def _start(self):
+        # The queue, events and flusher task only work on the loop that made them: set up anew on another
+        self._loop = asyncio.get_running_loop()
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closing = False
+        self._task = self._loop.create_task(self._run())
+
+    async def submit(self, row):
+        """Queue one row; returns it as stored (with its id) once its batch has committed."""
+        if self._loop is not asyncio.get_running_loop():
+            self._start()
+        elif self._task.done():
+            # The flusher died (e.g. cancelled): start another on the same queue
+            if not self._task.cancelled():
+                self._task.exception()
+            self._task = self._loop.create_task(self._run())
+        future = self._loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        # Shielded: a request that goes away must not fail the batch for the others
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                await self._wakeup.wait()
+                if self._closing and not self._pending:
+                    return
+                if len(self._pending) < self.max_rows and not self._closing:
+                    # Give concurrent requests the delay to join the batch
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.max_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+                if len(self._pending) < self.max_rows:
+                    self._full.clear()
+                if not self._pending and not self._closing:
+                    self._wakeup.clear()
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    # Whatever went wrong, the batch's requests get the error instead of waiting forever
+                    _fail(batch, e)
+        finally:
+            # Cancelled, possibly mid-flush: no flusher is left to answer these requests.
+            # Nothing to do after a normal return, every future is resolved by then.
+            queued, self._pending = self._pending, []
+            _fail(batch + queued, RuntimeError("The drink writer stopped before this drink was confirmed"))
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            async with write_session() as db:
+                created = await commit_drink_logs(db, [row for row, _, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Retry one by one, so a single bad row only fails its own request
+                for item in batch:
+                    await self._flush([item])
+                return
+            created = None
+            error = e
+        finished = time.perf_counter()
+        WRITE_BATCH_ROWS.observe(len(batch))
+        WRITE_FLUSH_SECONDS.observe(finished - started)
+
+        # RETURNING order isn't guaranteed to follow VALUES: hand rows back by content.
+        # Identical rows are interchangeable apart from their ids.
+        stored = defaultdict(list)
+        by_user = defaultdict(list)
+        for row in created or ():
+            stored[_content(row)].append(row)
+            by_user[row["user_id"]].append(row)
+        # One event per user and batch, like the one data version bump each of them got
+        for user_id, rows in by_user.items():
+            publish_drinks_logged(user_id, rows)
+        for row, future, submitted in batch:
+            WRITE_WAIT_SECONDS.observe(finished - submitted)
+            if future.done():
+                continue
+            if created is None:
+                future.set_exception(error)
+            else:
+                future.set_result(stored[_content(row)].pop())
+
+    async def close(self):
+        """Commit whatever is still queued, then stop the flusher."""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._loop = None
+
+
+drink_writer = GroupCommitWriter() if WRITE_BUFFER_ENABLED else None
+
+
+def get_drink_writer():
+    """The worker's GroupCommitWriter, or None when drinks are committed per request."""
+    return drink_writer
@@ -0,0 +1,237 @@
+# events.py
+"""In-process pub/sub behind the live event stream (GET /events/stream).
+
+Write routes publish a small delta for the user once their change has
+committed: drinks logged or deleted (with the per-day in/out count changes)
+and windows changed. Every open stream of that user gets it, so clients no
+longer re-poll /drinks/weekly-usage and /drinking-windows/ to notice them.
+
+Publishing never waits on a subscriber. Each stream has a queue of at most
+EVENT_QUEUE_SIZE events; when a client reads too slowly to keep up, its queue
+is emptied and replaced by a single `resync` event, which tells it to
+refetch. A stalled connection costs bounded memory and never slows a writer.
+
+The bus only sees writes made in this worker. Changes made elsewhere (another
+worker, reclassification, imports, `manage.py partitions`) still bump the
+user's data version, so every EVENT_VERSION_CHECK_SECONDS the bus reads the
+versions of its subscribed users, in one query per thousand users, and sends
+`resync` to those whose version moved more than the events it published.
+"""
+
+import asyncio
+import itertools
+import os
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from database import read_session
+from metrics import EVENT_RESYNCS, EVENT_STREAMS, EVENTS_PUBLISHED
+from models import User
+from serialization import dumps
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "64"))
+# How often the bus looks for changes it didn't publish (0 turns the check off)
+EVENT_VERSION_CHECK_SECONDS = float(os.getenv("EVENT_VERSION_CHECK_SECONDS", "30"))
+VERSION_CHECK_CHUNK = 1000
+
+RESYNC = "resync"
+
+
+def encode_event(event_id: int, event_type: str, data) -> bytes:
+    """One server-sent event, ready to write to the stream."""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event_type.encode(), dumps(data))
+
+
+class Subscription:
+    """One open stream: a bounded queue of encoded events."""
+
+    def __init__(self, bus, user_id: int, max_events: int):
+        self.user_id = user_id
+        self._bus = bus
+        self._queue = asyncio.Queue(max_events)
+        self._resync_queued = False
+
+    def put(self, event):
+        if self._resync_queued:
+            # The client refetches anyway
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: whatever is queued is moot once the client refetches
+            self.resync("overflow")
+
+    def resync(self, reason: str):
+        self._drain()
+        self._queue.put_nowait(self._bus.encode(RESYNC, {}))
+        self._resync_queued = True
+        EVENT_RESYNCS.inc(1, reason)
+
+    def close(self):
+        self._drain()
+        self._queue.put_nowait(None)
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def get(self):
+        """Wait for events; returns all queued ones as one chunk, or None once the bus has closed."""
+        events = [await self._queue.get()]
+        while not self._queue.empty():
+            events.append(self._queue.get_nowait())
+        self._resync_queued = False
+        if None in events:
+            return None
+        return b"".join(events)
+
+
+class EventBus:
+    """Subscriptions by user, for one event loop."""
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE, check_seconds=EVENT_VERSION_CHECK_SECONDS):
+        self.queue_size = queue_size
+        self.check_seconds = check_seconds
+        self._loop = None
+
+    def _start(self):
+        # Subscriptions and the version checker live on one loop; the first use on another starts over
+        self._loop = asyncio.get_running_loop()
+        self._subscribers = defaultdict(set)
+        self._ids = itertools.count(1)
+        # Per subscribed user: data version at the last check, and version-bumping events published since
+        self._versions = {}
+        self._published = defaultdict(int)
+        self._checker = None
+        if self.check_seconds > 0:
+            self._checker = self._loop.create_task(self._check_versions_periodically())
+
+    @property
+    def connections(self) -> int:
+        if self._loop is not asyncio.get_running_loop():
+            return 0
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def connections_of(self, user_id: int) -> int:
+        if self._loop is not asyncio.get_running_loop():
+            return 0
+        return len(self._subscribers.get(user_id, ()))
+
+    def encode(self, event_type: str, data) -> bytes:
+        return encode_event(next(self._ids), event_type, data)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        if self._loop is not asyncio.get_running_loop():
+            self._start()
+        subscription = Subscription(self, user_id, self.queue_size)
+        self._subscribers[user_id].add(subscription)
+        EVENT_STREAMS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if self._loop is not asyncio.get_running_loop():
+            return
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        EVENT_STREAMS.dec()
+        if not subscriptions:
+            del self._subscribers[subscription.user_id]
+            self._versions.pop(subscription.user_id, None)
+            self._published.pop(subscription.user_id, None)
+
+    def publish(self, user_id: int, event_type: str, data, bumps_version: bool = True):
+        """Send an event to the user's open streams. Call after the change has committed.
+
+        `bumps_version` says the change bumped the user's data version once,
+        as every write route does, so the version check doesn't resync for it.
+        """
+        EVENTS_PUBLISHED.inc(1, event_type)
+        if self._loop is not asyncio.get_running_loop():
+            return
+        subscriptions = self._subscribers.get(user_id)
+        if not subscriptions:
+            return
+        if bumps_version:
+            self._published[user_id] += 1
+        event = self.encode(event_type, data)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def resync(self, user_id: int, reason: str):
+        """Tell the user's open streams to refetch everything."""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.resync(reason)
+
+    async def check_versions(self):
+        """Resync users whose data version moved more than the events published for them."""
+        user_ids = list(self._subscribers)
+        published = {user_id: self._published[user_id] for user_id in user_ids}
+        versions = {}
+        for start in range(0, len(user_ids), VERSION_CHECK_CHUNK):
+            chunk = user_ids[start:start + VERSION_CHECK_CHUNK]
+            # On the primary: a lagging replica would look like missed or extra changes
+            async with read_session(use_primary=True) as db:
+                result = await db.execute(select(User.id, User.data_version).where(User.id.in_(chunk)))
+                versions.update(result.all())
+
+        for user_id, version in versions.items():
+            if user_id not in self._subscribers:
+                continue
+            previous = self._versions.get(user_id)
+            self._versions[user_id] = version
+            self._published[user_id] -= published[user_id]
+            if previous is not None and version - previous > published[user_id]:
+                self.resync(user_id, "version")
+
+    async def _check_versions_periodically(self):
+        while True:
+            await asyncio.sleep(self.check_seconds)
+            if not self._subscribers:
+                continue
+            try:
+                await self.check_versions()
+            except Exception:
+                # Database unavailable: streams keep what this worker publishes, check again later
+                continue
+
+    async def close(self):
+        """End every open stream and stop the version check."""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        if self._checker is not None:
+            self._checker.cancel()
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self._loop = None
+
+
+event_bus = EventBus()
+
+
+def _count_changes(drinks, sign):
+    # In/out-of-window drink counts per (UTC) day, as /drinks/summary counts them
+    days = {}
+    for drink in drinks:
+        counts = days.setdefault(drink["timestamp"].date(), {"in_window": 0, "out_window": 0})
+        counts["in_window" if drink["logged_in_window"] else "out_window"] += sign
+    return [{"day": day, **counts} for day, counts in sorted(days.items())]
+
+
+def publish_drinks_logged(user_id: int, drinks):
+    """`drinks` are DrinkLogOut-shaped dicts committed in one transaction."""
+    event_bus.publish(user_id, "drinks_logged", {"drinks": drinks, "counts": _count_changes(drinks, 1)})
+
+
+def publish_drink_deleted(user_id: int, drink):
+    event_bus.publish(user_id, "drink_deleted", {"id": drink["id"], "counts": _count_changes([drink], -1)})
+
+
+def publish_windows_changed(user_id: int, windows, deleted=()):
+    """`windows` are DrinkingWindowOut-shaped dicts as committed; `deleted` the ids of removed windows."""
+    event_bus.publish(user_id, "windows_changed", {"windows": windows, "deleted": list(deleted)})
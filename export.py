@@ -0,0 +1,121 @@
+# export.py
+"""Incremental encoders for drink history exports.
+
+Each encoder takes an iterable of row chunks (lists of tuples in `fields`
+order, as fetched from a server-side cursor) and yields bytes as soon as a
+chunk is encoded, so memory stays bounded by the chunk (or Parquet row group)
+size and the first bytes go out before the last rows are read.
+"""
+
+import csv
+import io
+from datetime import datetime
+from importlib.util import find_spec
+
+from serialization import dumps
+
+# pyarrow is optional, only needed for Parquet, and slow to import: look for it
+# here but import it on the first Parquet export
+PARQUET_AVAILABLE = find_spec("pyarrow") is not None
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows per Parquet row group: the unit buffered in memory before it is written out
+PARQUET_ROW_GROUP_SIZE = 50_000
+
+
+def drink_log_parquet_schema():
+    import pyarrow
+
+    # Same columns as DrinkLogOut; timestamps are stored as naive UTC
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("user_id", pyarrow.int64()),
+        ("drink_type", pyarrow.string()),
+        ("quantity", pyarrow.float64()),
+        ("timestamp", pyarrow.timestamp("us", tz="UTC")),
+        ("logged_in_window", pyarrow.bool_()),
+    ])
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def encode_csv(fields, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks:
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty history
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(fields, chunks):
+    for chunk in chunks:
+        yield b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def encode_parquet(schema, chunks, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """Parquet file streamed one row group at a time; `schema` is a pyarrow.Schema."""
+    import pyarrow
+    import pyarrow.parquet
+
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    pending = []
+
+    def row_group():
+        columns = list(zip(*pending))
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema,
+        ))
+        pending.clear()
+        return sink.drain()
+
+    for chunk in chunks:
+        pending.extend(chunk)
+        if len(pending) >= row_group_size:
+            yield row_group()
+    if pending:
+        yield row_group()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,107 @@
+# hashing.py
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# bcrypt cost factor. Pinning min/max to it makes any hash made with a different
+# cost "need update", so logins transparently rehash after the setting changes.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Worker processes for hashing (0 runs it in the threadpool instead), and how many
+# hash operations may be queued or running before new ones are turned away
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 8)))
+
+_pwd_context = None
+
+
+def get_pwd_context():
+    """The passlib CryptContext, built on first use: passlib and bcrypt are slow to import."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS,
+        )
+    return _pwd_context
+
+
+def load_bcrypt():
+    """Import passlib and load the bcrypt backend now rather than on the first hash."""
+    get_pwd_context().handler("bcrypt").get_backend()
+
+
+def get_password_hash(password):
+    return get_pwd_context().hash(password)
+
+def verify_password(plain_password, hashed_password):
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password, hashed_password):
+    """Returns (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+class HashingPool:
+    """Runs bcrypt in a bounded process pool so login bursts can't starve other requests.
+
+    When more than `max_pending` operations are in flight, new ones fail fast
+    with a 503 instead of queueing behind the backlog.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def warm(self):
+        """Start every worker process and load bcrypt in it (and here, for the threadpool path)."""
+        load_bcrypt()
+        if self.workers <= 0:
+            return
+        # One task per worker: the executor starts a new process for each task no idle one can take
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, load_bcrypt) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
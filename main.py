@@ -1,28 +1,138 @@
 # main.py
-from fastapi import FastAPI, Depends
+"""ASGI application factory.
+
+    uvicorn main:app                      # every router, settings from the environment
+    uvicorn --factory main:create_app
+
+Importing this module is cheap: routers are imported by create_app(), and
+the database engines, connection pools, passlib/bcrypt, python-jose and the
+window cache are set up during lifespan startup, before the worker reports
+ready. `python manage.py check-startup` holds the total to a time budget.
+"""
+
+import importlib
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+
+from database import DB_POOL_SIZE, init_engines, read_session, replica_usable, warm_pools
+from hashing import hashing_pool
+from metrics import STARTUP_SECONDS, MetricsMiddleware, render_metrics
+
+# Routers by name, in mounting order; each module has a `router`
+ROUTERS = {
+    "auth": "routers.auth",
+    "users": "routers.users",
+    "drinking_windows": "routers.drinking_windows",
+    "drinks": "routers.drinks",
+    "events": "routers.events",
+}
+
+
+def _env_list(name, default):
+    return tuple(item.strip() for item in os.getenv(name, default).split(",") if item.strip())
+
+
+@dataclass(frozen=True)
+class AppSettings:
+    # Names from ROUTERS to mount, e.g. APP_ROUTERS=auth,users for a test or a split deployment
+    routers: tuple = tuple(ROUTERS)
+    cors_origins: tuple = ("http://localhost:8080",)
+    # Connections opened per pool at startup, and users whose active windows are preloaded
+    warm_connections: int = DB_POOL_SIZE
+    warm_window_users: int = 1000
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            routers=_env_list("APP_ROUTERS", ",".join(ROUTERS)),
+            cors_origins=_env_list("CORS_ORIGINS", "http://localhost:8080"),
+            warm_connections=int(os.getenv("STARTUP_WARM_CONNECTIONS", str(DB_POOL_SIZE))),
+            warm_window_users=int(os.getenv("STARTUP_WARM_WINDOW_USERS", "1000")),
+        )
+
+
+async def warm_up(settings: AppSettings):
+    """Everything the first requests would otherwise pay for."""
+    from dependencies import load_jose
+    from window_index import warm_active_windows
+
+    init_engines()
+    await warm_pools(settings.warm_connections)
+    # First replica lag check, so the first reads can already go to the replica
+    await replica_usable()
+    load_jose()
+    if "auth" in settings.routers:
+        await hashing_pool.warm()
+    if settings.warm_window_users > 0:
+        async with read_session() as db:
+            await warm_active_windows(db, settings.warm_window_users)
+
+
+def create_app(settings: AppSettings = None) -> FastAPI:
+    settings = settings or AppSettings.from_env()
+    unknown = set(settings.routers) - set(ROUTERS)
+    if unknown:
+        raise ValueError(f"Unknown routers {sorted(unknown)}, expected some of {list(ROUTERS)}")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        started = time.perf_counter()
+        await warm_up(settings)
+        STARTUP_SECONDS.set(time.perf_counter() - started)
+        yield
+        from drink_writer import get_drink_writer
+        from events import event_bus
+
+        # Commit drinks still waiting in the group-commit buffer before the worker exits
+        writer = get_drink_writer()
+        if writer is not None:
+            await writer.close()
+        # End open event streams
+        await event_bus.close()
+        # Stop the password-hashing worker processes with the app
+        hashing_pool.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+
+    # Include routers
+    for name in ROUTERS:
+        if name in settings.routers:
+            app.include_router(importlib.import_module(ROUTERS[name]).router)
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.cors_origins),
+        allow_credentials=True,
+        allow_methods=["*"],  # Allow all HTTP methods (POST, GET, etc.)
+        allow_headers=["*"],  # Allow all headers
+    )
 
-from routers import auth,users, drinking_windows, drinks
+    # Request latency, in-flight and per-request SQL metrics, served at /metrics
+    app.add_middleware(MetricsMiddleware)
 
-app = FastAPI()
+    # GET ROUTES
+    @app.get("/")
+    def read_root():
+        return {"message": "Welcome to the Drinking Cessation App API"}
 
-# Include routers
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(drinking_windows.router)
-app.include_router(drinks.router)
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
+    return app
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:8080"],  # Replace with your frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods (POST, GET, etc.)
-    allow_headers=["*"],  # Allow all headers
-)
 
-# GET ROUTES
-@app.get("/")
-def read_root():
-    return {"message": "Welcome to the Drinking Cessation App API"}
+def __getattr__(name):
+    # `main.app` (uvicorn main:app, benchmarks) is built on first access, from the environment
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,237 @@
+# manage.py
+"""Maintenance commands, e.g. `python manage.py rebuild-rollups --user-id 42`."""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from database import SessionLocal, get_engine
+
+
+def rebuild_rollups_command(args):
+    from rollups import rebuild_rollups
+
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, user_id=args.user_id)
+        db.commit()
+    finally:
+        db.close()
+    print("Rebuilt drink_daily_rollups" + (f" for user {args.user_id}" if args.user_id else ""))
+
+
+def check_query_plans_command(args):
+    from query_plans import check_query_plans
+
+    regressions = 0
+    for name, (plan, regressed) in check_query_plans(get_engine()).items():
+        print(("FULL SCAN " if regressed else "ok        ") + name)
+        if regressed or args.verbose:
+            for line in plan:
+                print("    " + line)
+        regressions += regressed
+    if regressions:
+        print(f"{regressions} hot queries fall back to a full table scan")
+        sys.exit(1)
+
+
+def reclassify_command(args):
+    from sqlalchemy import func, select
+    from models import DrinkLog
+    from reclassify import _filters, reclassify
+
+    # Resume from the last committed chunk of an interrupted run with the same filters
+    filters = {"user_id": args.user_id, "start": args.start, "end": args.end}
+    after_id = 0
+    if args.resume and os.path.exists(args.state_file):
+        with open(args.state_file) as f:
+            state = json.load(f)
+        if state["filters"] != filters:
+            sys.exit(f"{args.state_file} was written for different filters: {state['filters']}")
+        after_id = state["last_id"]
+        print(f"Resuming after drink id {after_id}")
+
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    db = SessionLocal()
+    try:
+        total = db.execute(select(func.count()).where(
+            *_filters(args.user_id, start, end), DrinkLog.id > after_id
+        )).scalar()
+
+        def progress(last_id, scanned, changed):
+            with open(args.state_file, "w") as f:
+                json.dump({"filters": filters, "last_id": last_id}, f)
+            percent = 100 * scanned / total if total else 100
+            print(f"  up to id {last_id}: {scanned}/{total} scanned ({percent:.1f}%), {changed} changed", flush=True)
+
+        changed = reclassify(
+            db, user_id=args.user_id, start=start, end=end,
+            chunk_size=args.chunk_size, after_id=after_id, progress=progress
+        )
+    finally:
+        db.close()
+    if os.path.exists(args.state_file):
+        os.remove(args.state_file)
+    print(f"Reclassified {changed} drink logs")
+
+
+def import_drinks_command(args):
+    from sqlalchemy import select
+    from bulk_import import IMPORT_CHUNK_SIZE, import_drink_logs
+    from models import User
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    db = SessionLocal()
+    try:
+        user_id = db.execute(select(User.id).where(User.email == args.email)).scalar()
+        if user_id is None:
+            sys.exit(f"No user with email {args.email}")
+
+        def progress(report):
+            print(f"  {report['received']} rows read, {report['imported']} imported, "
+                  f"{report['duplicates']} duplicates, {report['rejected']} rejected "
+                  f"({report['rows_per_second']} rows/s)", flush=True)
+
+        stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+        try:
+            report = import_drink_logs(
+                db, user_id, stream, format, chunk_size=args.chunk_size or IMPORT_CHUNK_SIZE, progress=progress
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    finally:
+        db.close()
+
+    for error in report["errors"]:
+        print(f"  line {error['line']}: {error['detail']}")
+    print(f"Imported {report['imported']} of {report['received']} rows in {report['seconds']}s "
+          f"({report['rows_per_second']} rows/s)")
+
+
+def partitions_command(args):
+    from partitions import (
+        archive_partition, detach_partition, detached_partitions, ensure_partitions, expired_partitions,
+        is_partitioned,
+    )
+
+    engine = get_engine()
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            sys.exit("drink_logs is not partitioned; that needs Postgres and migration 4c8e1b7d9f20")
+
+    today = datetime.utcnow().date()
+    for name in ensure_partitions(engine, today, months_ahead=args.ahead):
+        print(f"Created {name}")
+    for month, name in sorted(expired_partitions(engine, today, retention_months=args.retention_months).items()):
+        detach_partition(engine, name)
+        print(f"Detached {name}")
+    if args.archive_dir:
+        # Also picks up tables a previous run detached but failed to archive
+        with engine.connect() as connection:
+            detached = detached_partitions(connection)
+        for month, name in sorted(detached.items()):
+            print(f"Archived {name} to {archive_partition(engine, name, args.archive_dir)}", flush=True)
+
+
+# Run in a fresh interpreter, so nothing is imported or connected beforehand
+STARTUP_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({"import": imported - started, "create_app": created - imported, "startup": ready - created}))
+"""
+
+
+def check_startup_command(args):
+    env = dict(os.environ)
+    if args.routers:
+        env["APP_ROUTERS"] = args.routers
+    worst = None
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        probe = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+        )
+        process = time.perf_counter() - started
+        if probe.returncode:
+            sys.exit(f"App failed to start:\n{probe.stderr}")
+        timings = json.loads(probe.stdout.strip().splitlines()[-1])
+        timings["ready"] = timings["import"] + timings["create_app"] + timings["startup"]
+        timings["process"] = process
+        print("  " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()), flush=True)
+        if worst is None or timings["ready"] > worst["ready"]:
+            worst = timings
+
+    # Cold starts are what autoscaling pays for, so the slowest run counts
+    ready_ms = worst["ready"] * 1000
+    if ready_ms > args.budget_ms:
+        print(f"Import to ready took {ready_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"Import to ready in {ready_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ShrinkSip maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="Recompute per-day drink rollups from drink_logs")
+    rebuild.add_argument("--user-id", type=int, default=None, help="Only rebuild this user's rollups")
+    rebuild.set_defaults(func=rebuild_rollups_command)
+
+    plans = commands.add_parser("check-query-plans", help="Fail if a hot route query needs a full table scan")
+    plans.add_argument("--verbose", action="store_true", help="Print every plan, not just regressions")
+    plans.set_defaults(func=check_query_plans_command)
+
+    reclass = commands.add_parser("reclassify", help="Recompute drink_logs.logged_in_window from window history")
+    reclass.add_argument("--user-id", type=int, default=None, help="Only this user's drinks")
+    reclass.add_argument("--start", help="Only drinks at or after this ISO timestamp")
+    reclass.add_argument("--end", help="Only drinks before this ISO timestamp")
+    reclass.add_argument("--chunk-size", type=int, default=5000, help="Rows per UPDATE/commit")
+    reclass.add_argument("--state-file", default=".reclassify_state.json", help="Progress checkpoint file")
+    reclass.add_argument("--resume", action="store_true", help="Continue from the checkpoint in --state-file")
+    reclass.set_defaults(func=reclassify_command)
+
+    importer = commands.add_parser("import-drinks", help="Bulk-load a user's drink history from CSV or NDJSON")
+    importer.add_argument("path", help="Input file, or - for stdin")
+    importer.add_argument("--email", required=True, help="User to import the drinks for")
+    importer.add_argument("--format", choices=("csv", "ndjson"), help="Input format (default: by file extension)")
+    importer.add_argument("--chunk-size", type=int, default=None, help="Rows per COPY/INSERT and commit")
+    importer.set_defaults(func=import_drinks_command)
+
+    from partitions import DRINK_LOG_RETENTION_MONTHS, PARTITION_MONTHS_AHEAD
+
+    parts = commands.add_parser("partitions", help="Create upcoming drink_logs partitions, detach/archive expired ones")
+    parts.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="Months to create past the current one")
+    parts.add_argument("--retention-months", type=int, default=DRINK_LOG_RETENTION_MONTHS,
+                       help="Full months kept besides the current one; older partitions are detached (0: keep all)")
+    parts.add_argument("--archive-dir", help="Write detached partitions here as .csv.gz, then drop them")
+    parts.set_defaults(func=partitions_command)
+
+    startup = commands.add_parser("check-startup", help="Fail if importing and starting the app exceeds a time budget")
+    startup.add_argument("--budget-ms", type=float, default=2000, help="Allowed time from `import main` to ready")
+    startup.add_argument("--runs", type=int, default=3, help="Fresh processes to time; the slowest is checked")
+    startup.add_argument("--routers", help="Comma-separated routers to mount (default: APP_ROUTERS or all)")
+    startup.set_defaults(func=check_startup_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
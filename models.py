@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Time, Float
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, Time, Float, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, time
@@ -16,6 +16,8 @@ class User(Base):
     timezone = Column(String(50), default='UTC')
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped on every change to the user's drinks or windows; served as the ETag
+    data_version = Column(Integer, nullable=False, default=0, server_default=text('0'))
 
     # Relationships
     drinking_windows = relationship("DrinkingWindow", back_populates="user")
@@ -24,6 +26,14 @@ class User(Base):
 
 class DrinkingWindow(Base):
     __tablename__ = 'drinking_windows'
+    __table_args__ = (
+        Index('ix_drinking_windows_user_id_is_active', 'user_id', 'is_active'),
+        # At most one active window per user, enforced by the database
+        Index(
+            'uq_drinking_windows_one_active_per_user', 'user_id', unique=True,
+            postgresql_where=text('is_active'), sqlite_where=text('is_active')
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -40,7 +50,12 @@ class DrinkingWindow(Base):
     user = relationship("User", back_populates="drinking_windows")
 
 class DrinkLog(Base):
+    # On Postgres the migrations partition this table by month of timestamp, with
+    # (id, timestamp) as primary key; see partitions.py
     __tablename__ = "drink_logs"
+    __table_args__ = (
+        Index("ix_drink_logs_user_id_timestamp", "user_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -49,4 +64,46 @@ class DrinkLog(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     logged_in_window = Column(Boolean, nullable=False)
 
-    user = relationship("User", back_populates="drink_logs")
\ No newline at end of file
+    user = relationship("User", back_populates="drink_logs")
+
+
+class DrinkDailyRollup(Base):
+    """Per-user, per-day drink counts, maintained incrementally alongside drink_logs."""
+    __tablename__ = "drink_daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC calendar day of DrinkLog.timestamp
+    in_window_count = Column(Integer, nullable=False, default=0)
+    out_window_count = Column(Integer, nullable=False, default=0)
+    in_window_quantity = Column(Float, nullable=False, default=0.0)
+    out_window_quantity = Column(Float, nullable=False, default=0.0)
+
+
+class DrinkingWindowVersion(Base):
+    """Append-only history of drinking windows: one row per state a window was in.
+
+    A row applies from effective_from until effective_to (NULL while it is the
+    window's current state). Written on every create, update and delete.
+    """
+    __tablename__ = "drinking_window_history"
+    __table_args__ = (
+        # Point-in-time lookup of a user's active window is one probe on this index
+        Index(
+            "ix_drinking_window_history_user_active_from", "user_id", "effective_from",
+            # SQLite only matches a partial index against the literal form the query uses
+            postgresql_where=text("is_active"), sqlite_where=text("is_active = 1")
+        ),
+        Index("ix_drinking_window_history_window_id", "window_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    window_id = Column(Integer, nullable=False)  # No FK: history outlives deleted windows
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    duration_hours = Column(Integer, nullable=False)
+    repeat_pattern = Column(String(50))
+    is_active = Column(Boolean, nullable=False)
+    window_created_at = Column(DateTime, nullable=False)
+    effective_from = Column(DateTime, nullable=False)
+    effective_to = Column(DateTime)
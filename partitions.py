@@ -0,0 +1,156 @@
+# partitions.py
+"""Monthly partitions of drink_logs on Postgres: creation ahead of time, retention and archival.
+
+The migration 4c8e1b7d9f20 makes drink_logs a table partitioned by RANGE
+(timestamp), one partition per calendar month (drink_logs_y2024m03), plus
+drink_logs_default for anything outside them. Every route filters or orders
+on timestamp, so the planner only touches the months a query covers.
+
+`python manage.py partitions` keeps this up (run it daily, e.g. from cron):
+
+- creates partitions for the coming months, and for any month that rows in
+  the default partition belong to, moving those rows over
+- detaches partitions older than the retention age; with an archive
+  directory they are also written to gzipped CSV and dropped
+
+Detached drinks stay counted in drink_daily_rollups, so /drinks/summary
+still covers the whole history (`rebuild-rollups` would drop them).
+"""
+
+import csv
+import gzip
+import os
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from data_versions import bump_data_version
+
+PARENT = "drink_logs"
+DEFAULT_PARTITION = "drink_logs_default"
+PARTITION_NAME = re.compile(r"^drink_logs_y(\d{4})m(\d{2})$")
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Full months of drinks kept attached besides the current one (0 keeps everything)
+DRINK_LOG_RETENTION_MONTHS = int(os.getenv("DRINK_LOG_RETENTION_MONTHS", "0"))
+
+ARCHIVE_CHUNK_SIZE = 10_000
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"drink_logs_y{month.year}m{month.month:02d}"
+
+
+def _month_of(name):
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent))"
+    ), {"parent": PARENT}).scalar()
+
+
+def attached_partitions(connection):
+    """{month: partition name} of the monthly partitions attached to drink_logs."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT}).scalars()
+    return {_month_of(name): name for name in names if _month_of(name)}
+
+
+def detached_partitions(connection):
+    """{month: table name} of monthly tables detached earlier but not archived yet."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_class c"
+        " WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace"
+        " AND c.relname LIKE 'drink\\_logs\\_y%' AND NOT c.relispartition"
+    )).scalars()
+    return {_month_of(name): name for name in names if _month_of(name)}
+
+
+def create_partition(connection, month: date):
+    """Attach a partition for `month`, taking over whatever the default partition holds for it."""
+    name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+    connection.exec_driver_sql(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    # A partition can't be attached while the default one holds rows in its range
+    connection.exec_driver_sql(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE "timestamp" >= '{start}' AND "timestamp" < '{end}'
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """)
+    connection.exec_driver_sql(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    return name
+
+
+def ensure_partitions(engine, today: date, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create missing partitions up to `months_ahead` months out and for rows in the default partition."""
+    with engine.connect() as connection:
+        existing = attached_partitions(connection)
+        default_months = connection.execute(text(
+            f'SELECT DISTINCT CAST(date_trunc(\'month\', "timestamp") AS date) FROM {DEFAULT_PARTITION}'
+        )).scalars().all()
+
+    current = today.replace(day=1)
+    wanted = {add_months(current, i) for i in range(months_ahead + 1)} | set(default_months)
+    created = []
+    for month in sorted(wanted - set(existing)):
+        # One transaction per partition, so a failure keeps the ones already made
+        with engine.begin() as connection:
+            created.append(create_partition(connection, month))
+    return created
+
+
+def expired_partitions(engine, today: date, retention_months=DRINK_LOG_RETENTION_MONTHS):
+    """{month: name} of attached partitions that ended before the retention cutoff."""
+    if retention_months <= 0:
+        return {}
+    cutoff = add_months(today.replace(day=1), -retention_months)
+    with engine.connect() as connection:
+        partitions = attached_partitions(connection)
+    return {month: name for month, name in partitions.items() if add_months(month, 1) <= cutoff}
+
+
+def detach_partition(engine, name):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        # Drink lists and exports change for everyone with drinks that month
+        connection.execute(bump_data_version())
+
+
+def archive_partition(engine, name, archive_dir):
+    """Write a detached partition to `<archive_dir>/<name>.csv.gz` (with a header row), then drop it."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = path + ".part"
+    with engine.connect() as connection, gzip.open(partial, "wt", newline="") as f:
+        if connection.dialect.driver == "psycopg2":
+            cursor = connection.connection.cursor()
+            try:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            finally:
+                cursor.close()
+        else:
+            result = connection.execution_options(stream_results=True).exec_driver_sql(f"SELECT * FROM {name}")
+            writer = csv.writer(f)
+            writer.writerow(result.keys())
+            for rows in result.partitions(ARCHIVE_CHUNK_SIZE):
+                writer.writerows(rows)
+    # Only a complete file replaces the table
+    os.replace(partial, path)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DROP TABLE {name}")
+    return path
@@ -0,0 +1,99 @@
+# query_plans.py
+"""EXPLAIN the queries behind the hot routes and flag any that fall back to a full table scan.
+
+Run with `python manage.py check-query-plans`; it exits non-zero on a regression,
+so it can gate migrations and model changes in CI.
+"""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select
+
+from models import DrinkDailyRollup, DrinkingWindow, DrinkLog, User
+
+SAMPLE_USER_ID = 1
+
+
+def hot_queries(dialect):
+    """Statements mirroring what the routers run on `dialect`, keyed by route."""
+    from routers.drinks import _drink_logs_query
+    from stats import stats_query
+    from window_history import versions_overlapping, window_at
+
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    return {
+        "auth: user by email": select(User).where(User.email == "someone@example.com"),
+        "POST /drinks/: active window": select(DrinkingWindow).where(
+            DrinkingWindow.user_id == SAMPLE_USER_ID,
+            DrinkingWindow.is_active == True
+        ),
+        "GET /drinks/": _drink_logs_query(select(DrinkLog), SAMPLE_USER_ID),
+        "GET /drinks/ (next page)": _drink_logs_query(
+            select(DrinkLog), SAMPLE_USER_ID, after=(week_ago, 1)
+        ).limit(100),
+        "GET /drinks/weekly-usage": select(DrinkLog).where(
+            DrinkLog.user_id == SAMPLE_USER_ID,
+            DrinkLog.timestamp >= week_ago
+        ),
+        "GET /drinks/summary": select(
+            func.sum(DrinkDailyRollup.in_window_count),
+            func.sum(DrinkDailyRollup.out_window_count),
+        ).where(DrinkDailyRollup.user_id == SAMPLE_USER_ID),
+        "GET /drinks/stats (rollups)": stats_query(
+            dialect, SAMPLE_USER_ID, "week", ZoneInfo("UTC"), week_ago.date(), week_ago.date() + timedelta(days=30)
+        ),
+        "GET /drinks/stats (local time)": stats_query(
+            dialect, SAMPLE_USER_ID, "hour", ZoneInfo("Europe/Paris"), week_ago.date(), week_ago.date() + timedelta(days=6)
+        ),
+        "DELETE /drinks/{id}": select(DrinkLog).where(
+            DrinkLog.id == 1,
+            DrinkLog.user_id == SAMPLE_USER_ID
+        ),
+        "GET /drinking-windows/": select(DrinkingWindow).where(DrinkingWindow.user_id == SAMPLE_USER_ID),
+        "GET /drinking-windows/weekly-usage": versions_overlapping(
+            SAMPLE_USER_ID, week_ago.date(), week_ago.date() + timedelta(days=6)
+        ),
+        "window history: point-in-time lookup": window_at(SAMPLE_USER_ID, week_ago),
+    }
+
+
+def explain(connection, statement):
+    """Return the plan lines for `statement` on this connection's dialect."""
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect)
+    if dialect.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if dialect.name == "postgresql":
+        rows = connection.exec_driver_sql("EXPLAIN " + str(compiled), params)
+        return [row[0] for row in rows]
+    if dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)
+        return [row[-1] for row in rows]
+    raise NotImplementedError(f"No plan inspection for dialect {dialect.name!r}")
+
+
+def is_full_scan(dialect_name, plan):
+    if dialect_name == "postgresql":
+        return any("Seq Scan" in line for line in plan)
+    # SQLite: "SCAN <table>" without an index is a full table scan, "SEARCH" is an index probe
+    return any(line.startswith("SCAN ") and "INDEX" not in line for line in plan)
+
+
+def check_query_plans(engine):
+    """Returns {route: (plan_lines, regressed)} for every hot query."""
+    results = {}
+    with engine.connect() as connection:
+        with connection.begin():
+            if connection.dialect.name == "postgresql":
+                # Small or freshly seeded tables are cheaper to scan, which would hide a
+                # missing index. With seq scans priced out the planner only picks one when
+                # no index can serve the query.
+                connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for name, statement in hot_queries(connection.dialect.name).items():
+                plan = explain(connection, statement)
+                results[name] = (plan, is_full_scan(connection.dialect.name, plan))
+    return results
@@ -0,0 +1,116 @@
+# rate_limit.py
+"""Token-bucket throttling for the auth routes.
+
+Every /auth request costs a full bcrypt operation, so a credential-stuffing
+burst or a client stuck in a retry loop could otherwise pin every core.
+`throttle_auth` runs before the route's own dependencies. It takes a token
+from the client IP's bucket, then the submitted email's, then the global one,
+and answers 429 with Retry-After as soon as one of them is empty.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from metrics import AUTH_THROTTLED
+
+
+class TokenBuckets:
+    """Token buckets by key: each refills at `rate` tokens per second up to `burst`.
+
+    At most `max_keys` buckets are kept, least recently used dropped first; a
+    dropped key comes back with a full bucket. A take is O(1) under one lock.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key=None) -> float:
+        """Take a token from `key`'s bucket; returns 0 if one was taken, else seconds until one is due."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Sustained attempts per second and burst size per client IP, per email and in
+# total (a rate of 0 turns that limit off). The global default leaves headroom
+# for a few bcrypt hashes per second per hashing worker.
+AUTH_IP_RATE = float(os.getenv("AUTH_IP_RATE", "0.2"))
+AUTH_IP_BURST = float(os.getenv("AUTH_IP_BURST", "10"))
+AUTH_EMAIL_RATE = float(os.getenv("AUTH_EMAIL_RATE", "0.1"))
+AUTH_EMAIL_BURST = float(os.getenv("AUTH_EMAIL_BURST", "5"))
+AUTH_GLOBAL_RATE = float(os.getenv("AUTH_GLOBAL_RATE", "20"))
+AUTH_GLOBAL_BURST = float(os.getenv("AUTH_GLOBAL_BURST", "40"))
+# Buckets kept per limiter, so memory stays bounded however many IPs and emails show up
+AUTH_RATE_LIMIT_MAX_KEYS = int(os.getenv("AUTH_RATE_LIMIT_MAX_KEYS", "100000"))
+
+ip_buckets = TokenBuckets(AUTH_IP_RATE, AUTH_IP_BURST, AUTH_RATE_LIMIT_MAX_KEYS)
+email_buckets = TokenBuckets(AUTH_EMAIL_RATE, AUTH_EMAIL_BURST, AUTH_RATE_LIMIT_MAX_KEYS)
+global_bucket = TokenBuckets(AUTH_GLOBAL_RATE, AUTH_GLOBAL_BURST)
+
+
+async def _submitted_email(request: Request):
+    # FastAPI has parsed the body before running dependencies, so this reads
+    # its cached copy: `email` in /register's JSON, `username` in /token's form
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            email = body.get("email") if isinstance(body, dict) else None
+        else:
+            email = (await request.form()).get("username")
+    except ValueError:
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def _too_many_requests(limit, retry_after):
+    AUTH_THROTTLED.inc(1, limit)
+    return HTTPException(
+        status_code=429,
+        detail="Too many authentication attempts, please retry later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def throttle_auth(request: Request):
+    """Router dependency: 429 once the client, the email or the whole worker is over its rate."""
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    client_ip = request.client.host if request.client else None
+    retry_after = ip_buckets.take(client_ip)
+    if retry_after:
+        raise _too_many_requests("ip", retry_after)
+
+    email = await _submitted_email(request)
+    if email is not None:
+        retry_after = email_buckets.take(email)
+        if retry_after:
+            raise _too_many_requests("email", retry_after)
+
+    retry_after = global_bucket.take()
+    if retry_after:
+        raise _too_many_requests("global", retry_after)
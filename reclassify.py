@@ -0,0 +1,139 @@
+# reclassify.py
+"""Recompute DrinkLog.logged_in_window with set-based, chunked UPDATEs.
+
+A drink is in-window when its time of day falls inside the user's active
+window version in effect at the drink's timestamp (drinking_window_history),
+using the same rules as window_index.WindowIntervals: bounds inclusive,
+wrap-around past midnight, 24h+ windows cover the whole day.
+"""
+
+from collections import defaultdict
+from types import SimpleNamespace
+
+from sqlalchemy import and_, exists, func, not_, or_, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import Float
+
+from data_versions import bump_data_versions
+from database import SessionLocal
+from models import DrinkingWindowVersion, DrinkLog
+from rollups import apply_drink_deltas
+
+RECLASSIFY_CHUNK_SIZE = 5000
+
+
+class seconds_of_day(FunctionElement):
+    """Seconds since midnight of a TIME or TIMESTAMP expression."""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(seconds_of_day, "postgresql")
+def _seconds_of_day_postgresql(element, compiler, **kw):
+    return "EXTRACT(EPOCH FROM CAST(%s AS TIME))" % compiler.process(element.clauses, **kw)
+
+
+@compiles(seconds_of_day, "sqlite")
+def _seconds_of_day_sqlite(element, compiler, **kw):
+    # Whole seconds only; SQLite is for local development
+    value = compiler.process(element.clauses, **kw)
+    return (
+        f"(CAST(strftime('%H', {value}) AS INTEGER) * 3600"
+        f" + CAST(strftime('%M', {value}) AS INTEGER) * 60"
+        f" + CAST(strftime('%S', {value}) AS INTEGER))"
+    )
+
+
+def in_window_expression():
+    """Correlated boolean expression: is this drink_logs row inside its window?"""
+    version = DrinkingWindowVersion
+    at = seconds_of_day(DrinkLog.timestamp)
+    start, end = seconds_of_day(version.start_time), seconds_of_day(version.end_time)
+    return exists().where(
+        version.user_id == DrinkLog.user_id,
+        version.is_active == True,
+        version.effective_from <= DrinkLog.timestamp,
+        or_(version.effective_to.is_(None), version.effective_to > DrinkLog.timestamp),
+        or_(
+            version.duration_hours >= 24,
+            and_(start <= end, at >= start, at <= end),
+            and_(start > end, or_(at >= start, at <= end)),
+        ),
+    )
+
+
+def _filters(user_id, start, end):
+    filters = [DrinkLog.timestamp.isnot(None)]
+    if user_id is not None:
+        filters.append(DrinkLog.user_id == user_id)
+    if start is not None:
+        filters.append(DrinkLog.timestamp >= start)
+    if end is not None:
+        filters.append(DrinkLog.timestamp < end)
+    return filters
+
+
+def reclassify(db, user_id=None, start=None, end=None, chunk_size=RECLASSIFY_CHUNK_SIZE,
+               after_id=0, progress=None):
+    """Recompute logged_in_window for drinks matching the filters, one id-range chunk per transaction.
+
+    Each chunk flips the rows whose flag changes, moves them between the in-
+    and out-of-window columns of their daily rollups and bumps their users'
+    data versions, all in one commit. `progress(last_id, scanned, changed)`
+    is called after every commit; pass the last reported id back as
+    `after_id` to resume an interrupted run. Returns the number of rows changed.
+    """
+    filters = _filters(user_id, start, end)
+    flag = in_window_expression()
+    scanned = changed = 0
+
+    while True:
+        chunk = select(DrinkLog.id).where(
+            *filters, DrinkLog.id > after_id
+        ).order_by(DrinkLog.id).limit(chunk_size).subquery()
+        upto, count = db.execute(select(func.max(chunk.c.id), func.count())).one()
+        if upto is None:
+            break
+
+        # Rows are locked until the commit, so the rollup deltas match what the UPDATE flips
+        flipped = db.execute(
+            select(DrinkLog.id, DrinkLog.user_id, DrinkLog.timestamp, DrinkLog.quantity, DrinkLog.logged_in_window)
+            .where(*filters, DrinkLog.id > after_id, DrinkLog.id <= upto, DrinkLog.logged_in_window != flag)
+            .with_for_update()
+        ).all()
+        if flipped:
+            db.execute(
+                update(DrinkLog)
+                .where(DrinkLog.id.in_([row.id for row in flipped]))
+                .values(logged_in_window=not_(DrinkLog.logged_in_window))
+                .execution_options(synchronize_session=False)
+            )
+            by_user = defaultdict(list)
+            for row in flipped:
+                by_user[row.user_id].append(row)
+            for row_user_id, rows in by_user.items():
+                apply_drink_deltas(db, row_user_id, rows, sign=-1)
+                apply_drink_deltas(db, row_user_id, [
+                    SimpleNamespace(timestamp=row.timestamp, quantity=row.quantity, logged_in_window=not row.logged_in_window)
+                    for row in rows
+                ])
+            db.execute(bump_data_versions(list(by_user)))
+        db.commit()
+
+        after_id = upto
+        scanned += count
+        changed += len(flipped)
+        if progress is not None:
+            progress(after_id, scanned, changed)
+
+    return changed
+
+
+def reclassify_in_background(user_id, start=None, end=None):
+    """Entry point for BackgroundTasks: runs on its own session after the response is sent."""
+    db = SessionLocal()
+    try:
+        reclassify(db, user_id=user_id, start=start, end=end)
+    finally:
+        db.close()
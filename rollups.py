@@ -0,0 +1,113 @@
+# rollups.py
+
+from collections import defaultdict
+from datetime import date, datetime, time
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import DrinkDailyRollup, DrinkLog
+
+ROLLUP_COLUMNS = ("in_window_count", "out_window_count", "in_window_quantity", "out_window_quantity")
+
+_UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _daily_deltas(drinks, sign):
+    deltas = defaultdict(lambda: dict.fromkeys(ROLLUP_COLUMNS, 0))
+    for drink in drinks:
+        bucket = deltas[drink.timestamp.date()]
+        if drink.logged_in_window:
+            bucket["in_window_count"] += sign
+            bucket["in_window_quantity"] += sign * drink.quantity
+        else:
+            bucket["out_window_count"] += sign
+            bucket["out_window_quantity"] += sign * drink.quantity
+    return deltas
+
+
+def apply_drink_deltas(db: Session, user_id: int, drinks, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) drinks from the user's daily rollups.
+
+    `drinks` are DrinkLog instances or rows with the same attributes. Runs in
+    the caller's transaction, so commit together with the drink_logs change.
+    """
+    deltas = _daily_deltas(drinks, sign)
+    if not deltas:
+        return
+
+    rows = [dict(user_id=user_id, day=day, **values) for day, values in deltas.items()]
+    upsert = _UPSERT_DIALECTS.get(db.bind.dialect.name)
+    if upsert is not None:
+        stmt = upsert(DrinkDailyRollup).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DrinkDailyRollup.user_id, DrinkDailyRollup.day],
+            set_={
+                column: getattr(DrinkDailyRollup, column) + getattr(stmt.excluded, column)
+                for column in ROLLUP_COLUMNS
+            }
+        ))
+        return
+
+    # Generic fallback for dialects without an ON CONFLICT upsert
+    for row in rows:
+        rollup = db.query(DrinkDailyRollup).get((user_id, row["day"]))
+        if rollup is None:
+            db.add(DrinkDailyRollup(**row))
+        else:
+            for column in ROLLUP_COLUMNS:
+                setattr(rollup, column, getattr(rollup, column) + row[column])
+
+
+def rebuild_rollups(db: Session, user_id: int = None, start: date = None, end: date = None):
+    """Recompute rollups from drink_logs, for one user or for everyone.
+
+    `start`/`end` restrict the rebuild to days in [start, end).
+    """
+    delete = db.query(DrinkDailyRollup)
+    if user_id is not None:
+        delete = delete.filter(DrinkDailyRollup.user_id == user_id)
+    if start is not None:
+        delete = delete.filter(DrinkDailyRollup.day >= start)
+    if end is not None:
+        delete = delete.filter(DrinkDailyRollup.day < end)
+    delete.delete(synchronize_session=False)
+
+    day = func.date(DrinkLog.timestamp)
+    aggregate = db.query(
+        DrinkLog.user_id,
+        day,
+        func.sum(case((DrinkLog.logged_in_window, 1), else_=0)),
+        func.sum(case((DrinkLog.logged_in_window, 0), else_=1)),
+        func.sum(case((DrinkLog.logged_in_window, DrinkLog.quantity), else_=0.0)),
+        func.sum(case((DrinkLog.logged_in_window, 0.0), else_=DrinkLog.quantity)),
+    ).filter(DrinkLog.timestamp.isnot(None))
+    if user_id is not None:
+        aggregate = aggregate.filter(DrinkLog.user_id == user_id)
+    if start is not None:
+        aggregate = aggregate.filter(DrinkLog.timestamp >= datetime.combine(start, time.min))
+    if end is not None:
+        aggregate = aggregate.filter(DrinkLog.timestamp < datetime.combine(end, time.min))
+    aggregate = aggregate.group_by(DrinkLog.user_id, day)
+
+    table = DrinkDailyRollup.__table__
+    db.execute(table.insert().from_select(
+        ["user_id", "day", *ROLLUP_COLUMNS],
+        aggregate.statement
+    ))
+
+
+def get_summary(db: Session, user_id: int):
+    in_window, out_window = db.query(
+        func.coalesce(func.sum(DrinkDailyRollup.in_window_count), 0),
+        func.coalesce(func.sum(DrinkDailyRollup.out_window_count), 0),
+    ).filter(DrinkDailyRollup.user_id == user_id).one()
+    return {
+        "total_drinks": in_window + out_window,
+        "in_window": in_window,
+        "out_window": out_window
+    }
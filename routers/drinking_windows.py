@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime, timedelta
-
-from database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+
+from data_versions import bump_data_version, data_etag, etag_headers, not_modified
+from database import get_async_db, read_session, wrote_recently
 from models import DrinkingWindow
 from schemas import DrinkingWindowCreate, DrinkingWindowOut, DrinkingWindowUpdate
-from dependencies import get_current_user
+from dependencies import get_current_user, get_read_db, user_timezone
+from events import publish_windows_changed
+from reclassify import reclassify_in_background
+from serialization import RowsResponse, columns_for
+from singleflight import single_flight
+from window_history import get_window_history, invalidate_window_history, record_window_version
+from window_index import invalidate_active_windows
 
 
 # Initialize the router
@@ -15,96 +24,109 @@ router = APIRouter(
     tags=["Drinking Windows"]
 )
 
+# Longest range /weekly-usage answers in one request (about ten years)
+MAX_HISTORY_DAYS = 3660
+
+WINDOW_FIELDS = tuple(DrinkingWindowOut.model_fields)
+WINDOW_COLUMNS = columns_for(DrinkingWindow, DrinkingWindowOut)
+
+ACTIVE_WINDOW_CONFLICT = "You already have an active drinking window. Please deactivate it before creating a new one."
+# How a violation of models.DrinkingWindow's one-active-window index reads: Postgres
+# names the index, SQLite only its column
+ACTIVE_WINDOW_INDEX_ERRORS = (
+    "uq_drinking_windows_one_active_per_user",
+    "UNIQUE constraint failed: drinking_windows.user_id",
+)
+
+def _is_active_window_conflict(error: IntegrityError) -> bool:
+    message = str(error.orig)
+    return any(marker in message for marker in ACTIVE_WINDOW_INDEX_ERRORS)
+
+async def _save_window_changes(db, user_id, windows, deleted=False):
+    # Flush the changes, append the windows' new versions to the history table, bump
+    # the user's data version and commit, all in one transaction. The one-active-window-per-user unique index
+    # rejects a second active window. Open event streams get the committed windows.
+    now = datetime.utcnow()
+    try:
+        await db.flush()
+        for window in windows:
+            await record_window_version(db, window, now, deleted=deleted)
+        await db.execute(bump_data_version(user_id))
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if not _is_active_window_conflict(error):
+            raise
+        raise HTTPException(status_code=400, detail=ACTIVE_WINDOW_CONFLICT)
+    if deleted:
+        publish_windows_changed(user_id, [], deleted=[window.id for window in windows])
+    else:
+        publish_windows_changed(user_id, [{field: getattr(window, field) for field in WINDOW_FIELDS} for window in windows])
+    return now
+
+def _windows_changed(user_id, changed_at, background_tasks):
+    # Drop everything derived from this user's windows; call after committing a change
+    invalidate_active_windows(user_id)
+    invalidate_window_history(user_id)
+    # Drinks already logged with later timestamps now fall under the new window version
+    background_tasks.add_task(reclassify_in_background, user_id, start=changed_at)
+
+async def _get_user_window(db, window_id, user_id):
+    result = await db.execute(select(DrinkingWindow).where(
+        DrinkingWindow.id == window_id,
+        DrinkingWindow.user_id == user_id
+    ))
+    return result.scalars().first()
+
 @router.get("/", response_model=List[DrinkingWindowOut])
-def get_drinking_windows(
-    db: Session = Depends(get_db),
+async def get_drinking_windows(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
     current_user=Depends(get_current_user),
 ):
-    windows = db.query(DrinkingWindow).filter(DrinkingWindow.user_id == current_user.id).all()
-    return windows
+    etag = await data_etag(db, current_user.id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    result = await db.execute(select(*WINDOW_COLUMNS).where(DrinkingWindow.user_id == current_user.id))
+    return RowsResponse(WINDOW_FIELDS, result.all(), headers=etag_headers(etag))
     
+@single_flight
+async def _window_history(user_id, etag, use_primary, start, end):
+    # Shared by concurrent requests of the same user, range and data version
+    async with read_session(use_primary=use_primary) as db:
+        return await get_window_history(db, user_id, start, end)
+
 @router.get("/weekly-usage")
-def get_weekly_drinking_windows(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get the past 7 days
-    today = datetime.now().date()
-    past_week = [today - timedelta(days=i) for i in range(7)]
-    user_id = current_user.id
-
-    # Query to fetch applicable windows for the past week
-    query = f"""
-        WITH date_series AS (
-            SELECT generate_series(
-                NOW()::date - interval '6 days',
-                NOW()::date,
-                interval '1 day'
-            )::date AS active_date
-        ),
-        active_windows AS (
-            SELECT
-                ds.active_date,
-                dw.id AS window_id,
-                dw.start_time,
-                dw.end_time,
-                dw.duration_hours,
-                dw.repeat_pattern,
-                dw.is_active,
-                dw.created_at,
-                dw.updated_at
-            FROM date_series ds
-            LEFT JOIN drinking_windows dw
-                ON dw.user_id = :user_id
-                AND dw.created_at::date <= ds.active_date
-                AND (dw.is_active OR dw.updated_at::date >= ds.active_date)
-        )
-        SELECT DISTINCT ON (active_date)
-            active_date,
-            window_id,
-            start_time,
-            end_time,
-            duration_hours,
-            repeat_pattern,
-            is_active,
-            created_at,
-            updated_at
-        FROM active_windows
-        ORDER BY active_date ASC, created_at DESC;
+async def get_weekly_drinking_windows(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Which drinking window applied on each day, oldest first.
+
+    Defaults to the past 7 days ending today in the user's timezone; pass
+    `start`/`end` for any other range.
     """
-    result = db.execute(query, {"user_id": user_id}).fetchall()
-
-    # Format the results
-    return [
-        {
-            "active_date": row["active_date"],
-            "window_id": row["window_id"],
-            "start_time": row["start_time"],
-            "end_time": row["end_time"],
-            "duration_hours": row["duration_hours"],
-            "repeat_pattern": row["repeat_pattern"],
-            "is_active": row["is_active"],
-            "created_at": row["created_at"],
-            "updated_at": row["updated_at"],
-        }
-        for row in result
-    ]
+    today = datetime.now(user_timezone(current_user)).date()
+    end = end or today
+    start = start or end - timedelta(days=6)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= MAX_HISTORY_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_HISTORY_DAYS} days")
+
+    etag = await data_etag(db, current_user.id)
+    return await _window_history(current_user.id, etag, wrote_recently(current_user.id), start, end)
 
 @router.post("/", response_model=DrinkingWindowOut)
-def create_drinking_window(
+async def create_drinking_window(
     drinking_window: DrinkingWindowCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
-    # Check if user already has an active drinking window
-    existing_active_window = db.query(DrinkingWindow).filter(
-        DrinkingWindow.user_id == current_user.id,
-        DrinkingWindow.is_active == True
-    ).first()
-
-    if existing_active_window:
-        raise HTTPException(
-            status_code=400,
-            detail="You already have an active drinking window. Please deactivate it before creating a new one."
-        )
-
     # Calculate end_time based on start_time and duration_hours
     start_time = drinking_window.start_time
     duration_hours = drinking_window.duration_hours
@@ -120,34 +142,38 @@ def create_drinking_window(
         user_id=current_user.id,
     )
     db.add(new_window)
-    db.commit()
-    db.refresh(new_window)
+    changed_at = await _save_window_changes(db, current_user.id, [new_window])
+    _windows_changed(current_user.id, changed_at, background_tasks)
+    await db.refresh(new_window)
     return new_window
 
 @router.put("/{window_id}", response_model=DrinkingWindowOut)
-def update_drinking_window(
+async def update_drinking_window(
     window_id: int,
     window_update: DrinkingWindowUpdate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
     # Fetch the drinking window belonging to the current user
-    window = db.query(DrinkingWindow).filter(
-        DrinkingWindow.id == window_id,
-        DrinkingWindow.user_id == current_user.id
-    ).first()
+    window = await _get_user_window(db, window_id, current_user.id)
 
     if not window:
         raise HTTPException(status_code=404, detail="Drinking window not found")
 
     # If activating a window, deactivate all other windows
+    deactivated = []
     if window_update.is_active and not window.is_active:
-        # Deactivate all other active windows
-        db.query(DrinkingWindow).filter(
+        # Deactivate all other active windows, flushed first so the unique index never sees two
+        result = await db.execute(select(DrinkingWindow).where(
             DrinkingWindow.user_id == current_user.id,
             DrinkingWindow.is_active == True,
             DrinkingWindow.id != window_id
-        ).update({"is_active": False}, synchronize_session=False)
+        ))
+        deactivated = result.scalars().all()
+        for other in deactivated:
+            other.is_active = False
+        await db.flush()
 
     # Update fields dynamically based on the provided values
     update_data = window_update.dict(exclude_unset=True)
@@ -162,29 +188,29 @@ def update_drinking_window(
         ).time()
 
     # Commit the changes to the database and refresh the window instance
-    db.commit()
-    db.refresh(window)
+    changed_at = await _save_window_changes(db, current_user.id, [*deactivated, window])
+    _windows_changed(current_user.id, changed_at, background_tasks)
+    await db.refresh(window)
 
     # Return the updated window, FastAPI will automatically use DrinkingWindowOut to serialize it
     return window
 
 
 @router.delete("/{window_id}", status_code=204)
-def delete_drinking_window(
+async def delete_drinking_window(
     window_id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
-    window = db.query(DrinkingWindow).filter(
-        DrinkingWindow.id == window_id,
-        DrinkingWindow.user_id == current_user.id
-    ).first()
+    window = await _get_user_window(db, window_id, current_user.id)
 
     if not window:
         raise HTTPException(status_code=404, detail="Drinking window not found")
 
-    db.delete(window)
-    db.commit()
+    await db.delete(window)
+    changed_at = await _save_window_changes(db, current_user.id, [window], deleted=True)
+    _windows_changed(current_user.id, changed_at, background_tasks)
     return
 
 
@@ -1,40 +1,110 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import asyncio
+import base64
+import io
 
-from database import get_db
-from models import DrinkLog, DrinkingWindow
-from schemas import DrinkLogCreate, DrinkLogOut
-from dependencies import get_current_user
-from typing import List
+from bulk_import import RequestBodyReader, import_drink_logs
+from data_versions import bump_data_version, data_etag, etag_headers, not_modified
+from drink_writer import get_drink_writer, insert_drink_logs
+from events import event_bus, publish_drink_deleted, publish_drinks_logged
+from database import SessionLocal, get_async_db, read_session, sync_sessionmaker, wrote_recently
+from models import DrinkLog
+from schemas import DrinkLogCreate, DrinkLogOut, DrinkLogBatchOut, DrinkLogImportOut
+from dependencies import get_current_user, get_read_db, user_timezone
+from reclassify import reclassify_in_background
+from rollups import apply_drink_deltas, get_summary
+from export import EXPORT_MEDIA_TYPES, PARQUET_AVAILABLE, drink_log_parquet_schema, encode_csv, encode_ndjson, encode_parquet
+from serialization import RowsResponse, columns_for
+from singleflight import single_flight
+from stats import MAX_STATS_BUCKETS, get_stats
+from timestamps import naive_utc
+from window_history import WindowTimeline, versions_between
+from window_index import get_active_intervals
+from typing import Any, List, Literal, Optional
 
 router = APIRouter(
     prefix="/drinks",
     tags=["Drink Logs"]
 )
 
+# Upper bound on items accepted by POST /drinks/batch in a single request
+MAX_BATCH_SIZE = 1000
+
+# Largest page GET /drinks/ serves when paginating, and rows fetched per round trip when streaming
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+# List routes select just the DrinkLogOut columns and serialize the tuples directly
+DRINK_LOG_FIELDS = tuple(DrinkLogOut.model_fields)
+DRINK_LOG_COLUMNS = columns_for(DrinkLog, DrinkLogOut)
+
+# Content types accepted by POST /drinks/import when no format is given
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+# Drinks logged further back than this are classified against the window version in
+# effect at their timestamp (window history); newer ones against the cached active windows
+BACKFILL_RECLASSIFY_AFTER = timedelta(minutes=5)
+
+
+async def _window_classifier(db, user_id, timestamps, now):
+    # Returns timestamp -> in window?, agreeing with what reclassify would store
+    active_windows = await get_active_intervals(db, user_id)
+    cutoff = now - BACKFILL_RECLASSIFY_AFTER
+    backfilled = [t for t in timestamps if t < cutoff]
+    if not backfilled:
+        return active_windows.contains
+    result = await db.execute(versions_between(user_id, min(backfilled), max(backfilled)))
+    timeline = WindowTimeline(result.scalars().all())
+    return lambda timestamp: timeline.contains(timestamp) if timestamp < cutoff else active_windows.contains(timestamp)
+
+def _reclassify_backfill(background_tasks, user_id, timestamps, now):
+    # Safety net for a window edit committed between classifying and inserting
+    backfilled = [t for t in timestamps if t < now - BACKFILL_RECLASSIFY_AFTER]
+    if backfilled:
+        background_tasks.add_task(
+            reclassify_in_background, user_id,
+            start=min(backfilled), end=max(backfilled) + timedelta(microseconds=1)
+        )
+
+
 @router.post("/", response_model=DrinkLogOut)
-def log_drink(
+async def log_drink(
     drink_log: DrinkLogCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
-    # Check if there is an active drinking window
-    active_window = db.query(DrinkingWindow).filter(
-        DrinkingWindow.user_id == current_user.id,
-        DrinkingWindow.is_active == True
-    ).first()
-
-    logged_in_window = False  # Default to outside the window
+    now = datetime.utcnow()
+    drink_log.timestamp = naive_utc(drink_log.timestamp) if drink_log.timestamp else now
 
-    if active_window:
-        # Determine if the drink is within the active window
-        if drink_log.timestamp is None:
-            drink_log.timestamp = datetime.utcnow()
+    # Determine if the drink is within the window; current windows come from the
+    # in-memory interval index, usually without a query
+    in_window = await _window_classifier(db, current_user.id, [drink_log.timestamp], now)
+    logged_in_window = in_window(drink_log.timestamp)
 
-        drink_time = drink_log.timestamp.time()
-        if active_window.start_time <= drink_time <= active_window.end_time:
-            logged_in_window = True
+    writer = get_drink_writer()
+    if writer is not None:
+        # Group commit: answered once the batch this row joins has committed (the writer publishes it)
+        created = await writer.submit({
+            "user_id": current_user.id,
+            "drink_type": drink_log.drink_type,
+            "quantity": drink_log.quantity,
+            "timestamp": drink_log.timestamp,
+            "logged_in_window": logged_in_window,
+        })
+        _reclassify_backfill(background_tasks, current_user.id, [created["timestamp"]], now)
+        return created
 
     # Log the drink with the calculated status
     new_drink = DrinkLog(
@@ -45,65 +115,337 @@ def log_drink(
         user_id=current_user.id
     )
     db.add(new_drink)
-    db.commit()
-    db.refresh(new_drink)
+    await db.flush()
+    await db.run_sync(apply_drink_deltas, current_user.id, [new_drink])
+    await db.execute(bump_data_version(current_user.id))
+    await db.commit()
+    await db.refresh(new_drink)
+    publish_drinks_logged(current_user.id, [{field: getattr(new_drink, field) for field in DRINK_LOG_FIELDS}])
+    _reclassify_backfill(background_tasks, current_user.id, [new_drink.timestamp], now)
     return new_drink
 
+@router.post("/batch", response_model=DrinkLogBatchOut)
+async def log_drinks_batch(
+    items: List[Any],
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    """Log many drinks in one request, e.g. when a client syncs an offline backlog.
+
+    Items are validated one by one so a bad entry is reported back in
+    `errors` instead of rejecting the whole batch. Valid items are written
+    with a single multi-row INSERT and one commit.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, at most {MAX_BATCH_SIZE} items are accepted per request"
+        )
+
+    now = datetime.utcnow()
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            # Not-an-object items fail here too, as per-item errors
+            drink_log = DrinkLogCreate.model_validate(item)
+        except ValidationError as e:
+            errors.append({"index": index, "detail": e.errors()})
+            continue
+
+        timestamp = naive_utc(drink_log.timestamp) if drink_log.timestamp else now
+        rows.append({
+            "user_id": current_user.id,
+            "drink_type": drink_log.drink_type,
+            "quantity": drink_log.quantity,
+            "timestamp": timestamp,
+        })
+
+    created = []
+    if rows:
+        # Windows (and window history for backfilled drinks) are loaded once for the whole batch
+        in_window = await _window_classifier(db, current_user.id, [row["timestamp"] for row in rows], now)
+        for row in rows:
+            row["logged_in_window"] = in_window(row["timestamp"])
+        created, new_drinks = await insert_drink_logs(db, rows)
+        await db.run_sync(apply_drink_deltas, current_user.id, new_drinks)
+        await db.execute(bump_data_version(current_user.id))
+        await db.commit()
+        publish_drinks_logged(current_user.id, created)
+        _reclassify_backfill(background_tasks, current_user.id, [row["timestamp"] for row in rows], now)
+
+    return {"created": created, "errors": errors}
+
+@router.post("/import", response_model=DrinkLogImportOut)
+async def bulk_import_drink_logs(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    current_user=Depends(get_current_user),
+):
+    """Load drink history from a CSV (with a header row) or NDJSON request body.
+
+    The body is parsed as it arrives and loaded in large chunks, each
+    committed on its own; rows already stored with the same timestamp and
+    drink type are skipped, so a failed upload can be retried as is. Drinks
+    are classified against the window that was active at their timestamp.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = IMPORT_CONTENT_TYPES.get(content_type)
+        if format is None:
+            raise HTTPException(
+                status_code=415,
+                detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson"
+            )
+
+    def run_import():
+        db = SessionLocal()
+        try:
+            stream = io.TextIOWrapper(
+                io.BufferedReader(RequestBodyReader(request.stream())),
+                encoding="utf-8-sig", errors="replace", newline=""
+            )
+            return import_drink_logs(db, current_user.id, stream, format)
+        finally:
+            db.close()
+
+    report = await run_in_threadpool(run_import)
+    if report["imported"]:
+        # Too many drinks for a delta: open streams refetch
+        event_bus.resync(current_user.id, "import")
+    return report
+
+def _encode_cursor(log):
+    # Opaque keyset cursor pointing just past the given row in (timestamp, id) order
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, log_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _drink_logs_query(query, user_id, start=None, end=None, after=None):
+    # Works on both a sync Query and a select() statement. Bounds may carry a UTC offset;
+    # the column holds naive UTC
+    query = query.where(DrinkLog.user_id == user_id)
+    if start is not None:
+        query = query.where(DrinkLog.timestamp >= naive_utc(start))
+    if end is not None:
+        query = query.where(DrinkLog.timestamp < naive_utc(end))
+    if after is not None:
+        after_timestamp, after_id = after
+        after_timestamp = naive_utc(after_timestamp)
+        query = query.where(or_(
+            DrinkLog.timestamp > after_timestamp,
+            and_(DrinkLog.timestamp == after_timestamp, DrinkLog.id > after_id)
+        ))
+    return query.order_by(DrinkLog.timestamp, DrinkLog.id)
+
+async def _iterate_in_one_thread(iterator):
+    # StreamingResponse would advance a sync iterator on whichever threadpool thread is
+    # free, but a session (and pysqlite's connection) must stay on the thread that opened
+    # it: run every step, and the final close, on one thread of our own
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drink-stream")
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Queued behind any step still running, so the generator is never entered twice
+        executor.submit(iterator.close)
+        executor.shutdown(wait=False)
+
+def _drink_log_chunks(sessions, user_id, start=None, end=None, after=None, limit=None):
+    # Uses its own sync session: the request-scoped one may be closed before the body
+    # is sent. Iterate it with _iterate_in_one_thread.
+    db = sessions()
+    try:
+        query = _drink_logs_query(select(*DRINK_LOG_COLUMNS), user_id, start, end, after)
+        if limit is not None:
+            query = query.limit(limit)
+        # A server-side cursor hands rows over STREAM_CHUNK_SIZE at a time instead of all at once
+        result = db.execute(query.execution_options(stream_results=True))
+        yield from result.partitions(STREAM_CHUNK_SIZE)
+    finally:
+        db.close()
+
 @router.get("/", response_model=List[DrinkLogOut])
-def get_drink_logs(
-    db: Session = Depends(get_db),
+async def get_drink_logs(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_read_db),
     current_user=Depends(get_current_user),
 ):
-    # Fetch all drink logs for the current user
-    logs = db.query(DrinkLog).filter(DrinkLog.user_id == current_user.id).all()
-    
-    return logs
+    """List the current user's drink logs ordered by (timestamp, id).
 
-@router.get("/weekly-usage", response_model=List[DrinkLogOut])
-def get_weekly_logged_drinks(
-    db: Session = Depends(get_db),
+    Pass `limit` to page through the history: the cursor for the next page is
+    returned in the `X-Next-Cursor` header and goes back in as `after`.
+    `format=ndjson` streams one JSON object per line instead. `start`/`end`
+    without a UTC offset are taken as UTC. Responses carry an ETag; send it
+    back in `If-None-Match` to get a 304 while nothing changed.
+    """
+    after_key = _decode_cursor(after) if after is not None else None
+
+    etag = await data_etag(db, current_user.id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    headers = etag_headers(etag)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _iterate_in_one_thread(encode_ndjson(
+                DRINK_LOG_FIELDS,
+                _drink_log_chunks(sync_sessionmaker(db), current_user.id, start, end, after_key, limit)
+            )),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+
+    query = _drink_logs_query(select(*DRINK_LOG_COLUMNS), current_user.id, start, end, after_key)
+    if limit is None:
+        result = await db.execute(query)
+        return RowsResponse(DRINK_LOG_FIELDS, result.all(), headers=headers)
+
+    # Fetch one extra row to know whether another page follows
+    result = await db.execute(query.limit(limit + 1))
+    logs = result.all()
+    if len(logs) > limit:
+        logs = logs[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(logs[-1])
+    return RowsResponse(DRINK_LOG_FIELDS, logs, headers=headers)
+
+@router.get("/export")
+async def export_drink_logs(
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user=Depends(get_current_user),
 ):
+    """Download the user's drink history, oldest first, encoded while it is read.
+
+    Rows come off a server-side cursor in chunks, so memory use and time to
+    first byte do not depend on the size of the history. Parquet is written
+    one row group at a time. `start`/`end` select the range as in GET /drinks/:
+    offsets are honoured, naive values are UTC.
+    """
+    if format == "parquet" and not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server")
+
+    chunks = _drink_log_chunks(sync_sessionmaker(db), current_user.id, start, end)
+    if format == "csv":
+        body = encode_csv(DRINK_LOG_FIELDS, chunks)
+    elif format == "ndjson":
+        body = encode_ndjson(DRINK_LOG_FIELDS, chunks)
+    else:
+        body = encode_parquet(drink_log_parquet_schema(), chunks)
+
+    filename = f"drinks-{datetime.utcnow():%Y%m%d}.{format}"
+    return StreamingResponse(
+        _iterate_in_one_thread(body),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@single_flight
+async def _weekly_drink_rows(user_id, etag, use_primary):
+    # Shared by concurrent requests of the same user at the same data version
     today = datetime.utcnow()
     seven_days_ago = today - timedelta(days=7)
-    drinks = db.query(DrinkLog).filter(
-        DrinkLog.user_id == current_user.id,
-        DrinkLog.timestamp >= seven_days_ago
-    ).all()
-    return drinks
+    async with read_session(use_primary=use_primary) as db:
+        result = await db.execute(select(*DRINK_LOG_COLUMNS).where(
+            DrinkLog.user_id == user_id,
+            DrinkLog.timestamp >= seven_days_ago
+        ))
+        return result.all()
 
-@router.get("/summary")
-def get_drink_summary(
-    db: Session = Depends(get_db),
+@router.get("/weekly-usage", response_model=List[DrinkLogOut])
+async def get_weekly_logged_drinks(
+    db: AsyncSession = Depends(get_read_db),
+    current_user=Depends(get_current_user),
+):
+    etag = await data_etag(db, current_user.id)
+    rows = await _weekly_drink_rows(current_user.id, etag, wrote_recently(current_user.id))
+    return RowsResponse(DRINK_LOG_FIELDS, rows)
+
+@router.get("/stats")
+async def get_drink_stats(
+    bucket: Literal["hour", "day", "week", "month"] = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user=Depends(get_current_user),
 ):
-    logs = db.query(DrinkLog).filter(DrinkLog.user_id == current_user.id).all()
-    total_drinks = len(logs)
-    in_window = sum(1 for log in logs if log.logged_in_window)
-    out_window = total_drinks - in_window
+    """Drink counts, quantities and in/out-of-window splits per bucket, plus streaks.
 
-    return {
-        "total_drinks": total_drinks,
-        "in_window": in_window,
-        "out_window": out_window
-    }
+    Buckets follow the user's timezone. `start`/`end` are local dates
+    (inclusive) and default to the 30 days ending today.
+    """
+    zone = user_timezone(current_user)
+    end = end or datetime.now(zone).date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    days = (end - start).days + 1
+    if days * (24 if bucket == "hour" else 1) > MAX_STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATS_BUCKETS} buckets per request")
+
+    return await db.run_sync(get_stats, current_user.id, bucket, zone, start, end)
+
+@single_flight
+async def _summary(user_id, etag, use_primary):
+    # Served from the per-day rollups rather than scanning the full log
+    async with read_session(use_primary=use_primary) as db:
+        return await db.run_sync(get_summary, user_id)
+
+@router.get("/summary")
+async def get_drink_summary(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user=Depends(get_current_user),
+):
+    etag = await data_etag(db, current_user.id)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(etag_headers(etag))
+    return await _summary(current_user.id, etag, wrote_recently(current_user.id))
 
 @router.delete("/{drink_id}", status_code=204)
-def delete_drink(
+async def delete_drink(
     drink_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     # Fetch the drink log
-    drink = db.query(DrinkLog).filter(
+    result = await db.execute(select(DrinkLog).where(
         DrinkLog.id == drink_id,
         DrinkLog.user_id == current_user.id
-    ).first()
+    ))
+    drink = result.scalars().first()
 
     if not drink:
         raise HTTPException(status_code=404, detail="Drink log not found")
 
     # Delete the drink log
-    db.delete(drink)
-    db.commit()
+    deleted = {field: getattr(drink, field) for field in DRINK_LOG_FIELDS}
+    await db.run_sync(apply_drink_deltas, current_user.id, [drink], sign=-1)
+    await db.delete(drink)
+    await db.execute(bump_data_version(current_user.id))
+    await db.commit()
+    publish_drink_deleted(current_user.id, deleted)
     return
\ No newline at end of file
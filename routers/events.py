@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from database import read_session
+from dependencies import get_current_user, oauth2_scheme
+from events import event_bus
+
+router = APIRouter(
+    prefix="/events",
+    tags=["Events"]
+)
+
+# A comment line when nothing else was sent for this long, so proxies keep the
+# connection open and clients notice a dead one
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# Open streams allowed per worker, and per user (a few devices or tabs)
+EVENT_STREAM_MAX_CONNECTIONS = int(os.getenv("EVENT_STREAM_MAX_CONNECTIONS", "10000"))
+EVENT_STREAM_MAX_PER_USER = int(os.getenv("EVENT_STREAM_MAX_PER_USER", "5"))
+# How long EventSource clients wait before reconnecting
+EVENT_RETRY_MS = int(os.getenv("EVENT_RETRY_MS", "5000"))
+
+HEARTBEAT = b": ping\n\n"
+
+
+async def _stream_user(token: str = Depends(oauth2_scheme)):
+    # Authenticate on a short-lived session: an open stream must not keep a pooled connection
+    async with read_session() as db:
+        return await get_current_user(db, token)
+
+
+@router.get("/stream")
+async def stream_events(request: Request, current_user=Depends(_stream_user)):
+    """Server-sent events with the current user's changes, as they commit.
+
+    - `drinks_logged`: `{"drinks": [...], "counts": [...]}`
+    - `drink_deleted`: `{"id": ..., "counts": [...]}`
+    - `windows_changed`: `{"windows": [...], "deleted": [ids]}`
+    - `resync`: changes were missed, refetch everything
+
+    `counts` holds the change in in/out-of-window drinks per day. Events
+    aren't replayed: fetch the current state after connecting. A reconnect
+    with `Last-Event-ID` starts with `resync`. The connection limits are
+    checked as the request arrives, so streams opened at the same instant
+    can briefly exceed them.
+    """
+    if event_bus.connections >= EVENT_STREAM_MAX_CONNECTIONS:
+        raise HTTPException(status_code=503, detail="Too many open event streams", headers={"Retry-After": "30"})
+    if event_bus.connections_of(current_user.id) >= EVENT_STREAM_MAX_PER_USER:
+        raise HTTPException(status_code=429, detail=f"At most {EVENT_STREAM_MAX_PER_USER} event streams per user")
+    reconnected = request.headers.get("last-event-id") is not None
+
+    async def events():
+        # Subscribed once the response starts, so a request that never gets there leaves nothing behind
+        subscription = event_bus.subscribe(current_user.id)
+        try:
+            if reconnected:
+                subscription.resync("reconnect")
+            yield b"retry: %d\n\n" % EVENT_RETRY_MS
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(subscription.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx would otherwise hold events back in its buffer
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
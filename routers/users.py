@@ -1,7 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
 
-from database import get_db
 from schemas import UserOut
 from models import User
 from dependencies import get_current_user, get_password_hash
@@ -13,7 +11,7 @@ router = APIRouter(
 )
 
 @router.get("/me", response_model=UserOut)
-def read_users_me(
+async def read_users_me(
     current_user: User = Depends(get_current_user),
 ):
     """Retrieve the currently logged-in user's profile."""
@@ -21,6 +19,6 @@ def read_users_me(
 
 
 @router.get("/protected-endpoint")
-def protected_endpoint(current_user: User = Depends(get_current_user)):
+async def protected_endpoint(current_user: User = Depends(get_current_user)):
     return {"message": f"Hello, {current_user.email}!"}
 
@@ -1,7 +1,7 @@
 # schemas.py
 
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Any
 from datetime import datetime, time
 
 class UserBase(BaseModel):
@@ -49,6 +49,29 @@ class DrinkLogOut(BaseModel):
     class Config:
         orm_mode = True
 
+# Batch logging: one error entry per rejected item, keyed by its position in the request
+class DrinkLogBatchError(BaseModel):
+    index: int
+    detail: Any
+
+class DrinkLogBatchOut(BaseModel):
+    created: List[DrinkLogOut]
+    errors: List[DrinkLogBatchError]
+
+# Bulk import report; errors are keyed by input line number
+class DrinkLogImportError(BaseModel):
+    line: int
+    detail: Any
+
+class DrinkLogImportOut(BaseModel):
+    received: int
+    imported: int
+    duplicates: int
+    rejected: int
+    errors: List[DrinkLogImportError]
+    seconds: float
+    rows_per_second: Optional[float]
+
 class DrinkingWindowBase(BaseModel):
     start_time: Optional[time] = None
     end_time: Optional[time] = None
@@ -0,0 +1,49 @@
+# serialization.py
+"""Fast JSON path for list endpoints.
+
+List routes select plain column tuples and hand them to RowsResponse, which
+zips them with the field names and encodes the whole list in one call. Rows
+come straight from our own tables, so they skip per-row response_model
+validation; the route's response_model still documents the shape.
+orjson is used when installed, with the stdlib encoder as a fallback.
+"""
+
+import json
+from datetime import date, datetime, time
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+def columns_for(model, schema):
+    """The model columns backing each field of `schema`, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+class RowsResponse(Response):
+    """JSON array response built from `(field names, row tuples)` without per-row validation."""
+    media_type = "application/json"
+
+    def __init__(self, fields, rows, **kwargs):
+        fields = tuple(fields)
+        super().__init__(content=[dict(zip(fields, row)) for row in rows], **kwargs)
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
@@ -0,0 +1,58 @@
+# singleflight.py
+"""Request coalescing: concurrent identical reads share one computation.
+
+A client coming back to the foreground fires the same few reads several
+times at once. With `@single_flight`, the first call starts the work as a task
+and calls with equal arguments that arrive while it runs await that same
+task, so a burst costs one query. Once the task finishes the key is
+released: later calls start fresh and never see an older result.
+
+Callers put everything the result depends on into the arguments, including
+the user's data version (see data_versions.py). Then a request that already
+sees a newer version cannot join a computation started before that write.
+"""
+
+import asyncio
+import functools
+
+from metrics import SINGLE_FLIGHT_SHARED
+
+
+class SingleFlight:
+    """In-flight calls by key, for one event loop."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    async def run(self, key, fn, *args):
+        """Result of `fn(*args)`, or of the call already running under `key`."""
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            SINGLE_FLIGHT_SHARED.inc(1, self.name)
+        # A caller that goes away must not cancel the work for the others
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved, in case every caller was cancelled
+            task.exception()
+
+
+def single_flight(fn):
+    """Coalesce concurrent calls of a coroutine function that have equal (hashable) arguments.
+
+    The result is shared, so it must not be mutated by callers; the function
+    should open its own session, as the first caller's may close before it ends.
+    """
+    flight = SingleFlight(fn.__qualname__)
+
+    @functools.wraps(fn)
+    async def coalesced(*args):
+        return await flight.run(args, fn, *args)
+
+    return coalesced
@@ -0,0 +1,197 @@
+# stats.py
+"""Per-bucket drinking statistics, aggregated in SQL.
+
+Drinks are grouped by hour, day, week (starting Monday) or month of the
+user's local time, so the work and the response grow with the number of
+buckets rather than the number of drinks. Postgres converts timestamps with
+AT TIME ZONE; SQLite gets a CASE over the zone's UTC offsets in the range.
+Users on UTC are answered from the daily rollups unless bucketing by hour.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import DateTime, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from models import DrinkDailyRollup, DrinkLog
+from rollups import ROLLUP_COLUMNS
+
+# Keep per-bucket rows, and so the response, bounded
+MAX_STATS_BUCKETS = 10000
+
+
+def bucket_starts(bucket: str, start: date, end: date):
+    """Local start of every bucket overlapping [start, end], oldest first."""
+    if bucket == "hour":
+        current, step = datetime.combine(start, time.min), timedelta(hours=1)
+    elif bucket == "day":
+        current, step = datetime.combine(start, time.min), timedelta(days=1)
+    elif bucket == "week":
+        current, step = datetime.combine(start - timedelta(days=start.weekday()), time.min), timedelta(days=7)
+    else:
+        current, step = datetime.combine(start.replace(day=1), time.min), None
+    stop = datetime.combine(end + timedelta(days=1), time.min)
+
+    starts = []
+    while current < stop:
+        starts.append(current)
+        if step is not None:
+            current += step
+        else:
+            current = current.replace(year=current.year + current.month // 12, month=current.month % 12 + 1)
+    return starts
+
+
+def _to_utc(local: datetime, zone) -> datetime:
+    return local.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _offset(zone, utc: datetime) -> timedelta:
+    return utc.replace(tzinfo=timezone.utc).astimezone(zone).utcoffset()
+
+
+def _offset_segments(zone, start_utc: datetime, end_utc: datetime):
+    """[(segment end, UTC offset)] covering [start_utc, end_utc); the last end is None."""
+    segments = []
+    current = _offset(zone, start_utc)
+    day = start_utc
+    while day < end_utc:
+        following = min(day + timedelta(days=1), end_utc)
+        if _offset(zone, following) != current:
+            # Narrow the transition down to the second
+            low, high = day, following
+            while high - low > timedelta(seconds=1):
+                middle = low + (high - low) / 2
+                if _offset(zone, middle) == current:
+                    low = middle
+                else:
+                    high = middle
+            high = high.replace(microsecond=0)
+            segments.append((high, current))
+            current = _offset(zone, high)
+        day = following
+    segments.append((None, current))
+    return segments
+
+
+def _sqlite_shift(column, offset: timedelta):
+    seconds = int(offset.total_seconds())
+    return func.datetime(column, f"{seconds:+d} seconds") if seconds else func.datetime(column)
+
+
+def _local_timestamp(dialect: str, column, zone, start_utc, end_utc):
+    if dialect == "postgresql":
+        return func.timezone(zone.key, func.timezone("UTC", column))
+    segments = _offset_segments(zone, start_utc, end_utc)
+    if len(segments) == 1:
+        return _sqlite_shift(column, segments[0][1])
+    return case(
+        *[(column < until, _sqlite_shift(column, offset)) for until, offset in segments[:-1]],
+        else_=_sqlite_shift(column, segments[-1][1]),
+    )
+
+
+def _truncate(dialect: str, value, bucket: str):
+    if dialect == "postgresql":
+        return func.date_trunc(bucket, value)
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%d %H:00:00", value)
+    if bucket == "day":
+        return func.date(value)
+    if bucket == "week":
+        # Forward to Sunday, then back to that week's Monday
+        return func.date(value, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", value)
+
+
+def _as_datetime(value) -> datetime:
+    # Postgres returns timestamps, SQLite strings
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    return value
+
+
+def _streaks(flags):
+    longest = current = 0
+    for flag in flags:
+        current = current + 1 if flag else 0
+        longest = max(longest, current)
+    return {"current": current, "longest": longest}
+
+
+def stats_query(dialect: str, user_id: int, bucket: str, zone, start: date, end: date):
+    """(bucket start, in/out-window counts, in/out-window quantities) per non-empty bucket."""
+    start_utc = _to_utc(datetime.combine(start, time.min), zone)
+    end_utc = _to_utc(datetime.combine(end + timedelta(days=1), time.min), zone)
+
+    if bucket != "hour" and _offset_segments(zone, start_utc, end_utc) == [(None, timedelta(0))]:
+        # UTC days line up with the rollups' days
+        day = DrinkDailyRollup.day
+        if dialect == "postgresql":
+            # date_trunc on a date picks the timestamptz overload; keep bucket starts naive
+            day = cast(day, DateTime)
+        key = _truncate(dialect, day, bucket)
+        return select(
+            key, *[func.sum(getattr(DrinkDailyRollup, column)) for column in ROLLUP_COLUMNS]
+        ).where(
+            DrinkDailyRollup.user_id == user_id,
+            DrinkDailyRollup.day >= start,
+            DrinkDailyRollup.day <= end,
+        ).group_by(key)
+
+    local = _local_timestamp(dialect, DrinkLog.timestamp, zone, start_utc, end_utc)
+    key = _truncate(dialect, local, bucket)
+    return select(
+        key,
+        func.sum(case((DrinkLog.logged_in_window, 1), else_=0)),
+        func.sum(case((DrinkLog.logged_in_window, 0), else_=1)),
+        func.sum(case((DrinkLog.logged_in_window, DrinkLog.quantity), else_=0.0)),
+        func.sum(case((DrinkLog.logged_in_window, 0.0), else_=DrinkLog.quantity)),
+    ).where(
+        DrinkLog.user_id == user_id,
+        DrinkLog.timestamp >= start_utc,
+        DrinkLog.timestamp < end_utc,
+    ).group_by(key)
+
+
+def get_stats(db: Session, user_id: int, bucket: str, zone, start: date, end: date):
+    """Counts, quantities and in/out-of-window splits per bucket of local time, plus streaks.
+
+    Every bucket in [start, end] is returned, empty ones included. Streaks
+    count consecutive buckets up to the last one: `in_window` has no drink
+    outside the window, `dry` has no drink at all.
+    """
+    result = db.execute(stats_query(db.bind.dialect.name, user_id, bucket, zone, start, end))
+    rows = {_as_datetime(key): values for key, *values in result}
+
+    buckets = []
+    totals = dict.fromkeys(("count", "quantity", *ROLLUP_COLUMNS), 0)
+    for bucket_start in bucket_starts(bucket, start, end):
+        in_count, out_count, in_quantity, out_quantity = rows.get(bucket_start) or (0, 0, 0.0, 0.0)
+        entry = {
+            "start": bucket_start,
+            "count": in_count + out_count,
+            "quantity": float(in_quantity + out_quantity),
+            "in_window_count": in_count,
+            "out_window_count": out_count,
+            "in_window_quantity": float(in_quantity),
+            "out_window_quantity": float(out_quantity),
+        }
+        for name in totals:
+            totals[name] += entry[name]
+        buckets.append(entry)
+
+    return {
+        "bucket": bucket,
+        "timezone": zone.key,
+        "start": start,
+        "end": end,
+        "buckets": buckets,
+        "totals": totals,
+        "streaks": {
+            "in_window": _streaks(entry["out_window_count"] == 0 for entry in buckets),
+            "dry": _streaks(entry["count"] == 0 for entry in buckets),
+        },
+    }
@@ -0,0 +1,10 @@
+# timestamps.py
+
+from datetime import timezone
+
+
+def naive_utc(timestamp):
+    """Timestamps are stored as naive UTC; convert offset-aware client input."""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
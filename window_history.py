@@ -0,0 +1,172 @@
+# window_history.py
+
+import heapq
+import itertools
+import os
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import or_, select, update
+
+from cache import TTLCache
+from models import DrinkingWindowVersion
+from window_index import WindowIntervals
+
+# Results for ranges that end before today (UTC, like the days they resolve) are memoized
+# under the user's current generation; a window change gives the user a new one, which
+# orphans their entries. A user whose generation was evicted gets a new one too.
+WINDOW_HISTORY_CACHE_TTL_SECONDS = float(os.getenv("WINDOW_HISTORY_CACHE_TTL_SECONDS", "3600"))
+WINDOW_HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("WINDOW_HISTORY_CACHE_MAX_ENTRIES", "10000"))
+
+_history_cache = TTLCache(maxsize=WINDOW_HISTORY_CACHE_MAX_ENTRIES, ttl=WINDOW_HISTORY_CACHE_TTL_SECONDS)
+_generations = TTLCache(maxsize=WINDOW_HISTORY_CACHE_MAX_ENTRIES, ttl=WINDOW_HISTORY_CACHE_TTL_SECONDS)
+_generation_ids = itertools.count(1)
+
+
+def _window_row(day, version):
+    return {
+        "active_date": day,
+        "window_id": version.window_id if version else None,
+        "start_time": version.start_time if version else None,
+        "end_time": version.end_time if version else None,
+        "duration_hours": version.duration_hours if version else None,
+        "repeat_pattern": version.repeat_pattern if version else None,
+        "is_active": version.is_active if version else None,
+        "created_at": version.window_created_at if version else None,
+        # The window was last edited when this version took effect
+        "updated_at": version.effective_from if version else None,
+    }
+
+
+def _last_day(version):
+    if version.effective_to is None:
+        return date.max
+    # effective_to is exclusive: a version closed at midnight did not apply that day
+    return (version.effective_to - timedelta(microseconds=1)).date()
+
+
+def resolve_window_history(versions, start: date, end: date):
+    """Which window version applied on each day from start to end (inclusive).
+
+    `versions` are active DrinkingWindowVersion rows. When several overlap a
+    day (the window was edited that day) the latest one wins. Sweeps the days
+    once with a heap of candidates.
+    """
+    pending = sorted(versions, key=lambda v: v.effective_from)
+    candidates = []  # max-heap on effective_from
+    rows = []
+    i = 0
+    day = start
+    while day <= end:
+        while i < len(pending) and pending[i].effective_from.date() <= day:
+            version = pending[i]
+            heapq.heappush(candidates, (-version.effective_from.timestamp(), version.id, _last_day(version), version))
+            i += 1
+        # Versions that ended before today can never apply again
+        while candidates and candidates[0][2] < day:
+            heapq.heappop(candidates)
+        rows.append(_window_row(day, candidates[0][3] if candidates else None))
+        day += timedelta(days=1)
+    return rows
+
+
+def versions_overlapping(user_id: int, start: date, end: date):
+    # One range probe on the (user_id, effective_from) index of active versions
+    return select(DrinkingWindowVersion).where(
+        DrinkingWindowVersion.user_id == user_id,
+        DrinkingWindowVersion.is_active == True,
+        DrinkingWindowVersion.effective_from < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+        or_(DrinkingWindowVersion.effective_to.is_(None),
+            DrinkingWindowVersion.effective_to > datetime.combine(start, datetime.min.time()))
+    )
+
+
+def window_at(user_id: int, at: datetime):
+    """Statement selecting the user's active window version in effect at `at`, if any."""
+    # Active versions of one user never overlap, so the newest one starting
+    # at or before `at` is the only candidate
+    return select(DrinkingWindowVersion).where(
+        DrinkingWindowVersion.user_id == user_id,
+        DrinkingWindowVersion.is_active == True,
+        DrinkingWindowVersion.effective_from <= at,
+        or_(DrinkingWindowVersion.effective_to.is_(None), DrinkingWindowVersion.effective_to > at)
+    ).order_by(DrinkingWindowVersion.effective_from.desc()).limit(1)
+
+
+def versions_between(user_id: int, start: datetime, end: datetime):
+    """Statement selecting the user's active window versions in effect at some point in [start, end]."""
+    return select(DrinkingWindowVersion).where(
+        DrinkingWindowVersion.user_id == user_id,
+        DrinkingWindowVersion.is_active == True,
+        DrinkingWindowVersion.effective_from <= end,
+        or_(DrinkingWindowVersion.effective_to.is_(None), DrinkingWindowVersion.effective_to > start)
+    )
+
+
+class WindowTimeline:
+    """Classifies timestamps against the window version that was active at the time."""
+
+    def __init__(self, versions):
+        # Active versions of one user never overlap
+        versions = sorted(versions, key=lambda v: v.effective_from)
+        self._starts = [v.effective_from for v in versions]
+        self._versions = [(v.effective_to, WindowIntervals([v])) for v in versions]
+
+    def contains(self, timestamp):
+        i = bisect_right(self._starts, timestamp) - 1
+        if i < 0:
+            return False
+        effective_to, intervals = self._versions[i]
+        return (effective_to is None or timestamp < effective_to) and intervals.contains(timestamp)
+
+
+async def record_window_version(db, window, now: datetime, deleted: bool = False):
+    """Close the window's current version and, unless it was deleted, append its new state.
+
+    Call after flushing the window change, in the same transaction.
+    """
+    await db.execute(update(DrinkingWindowVersion).where(
+        DrinkingWindowVersion.window_id == window.id,
+        DrinkingWindowVersion.effective_to.is_(None)
+    ).values(effective_to=now))
+    if not deleted:
+        db.add(DrinkingWindowVersion(
+            window_id=window.id,
+            user_id=window.user_id,
+            start_time=window.start_time,
+            end_time=window.end_time,
+            duration_hours=window.duration_hours,
+            repeat_pattern=window.repeat_pattern,
+            is_active=window.is_active,
+            window_created_at=window.created_at,
+            effective_from=now,
+        ))
+
+
+def _generation(user_id: int):
+    generation = _generations.get(user_id)
+    if generation is None:
+        generation = next(_generation_ids)
+        _generations.set(user_id, generation)
+    return generation
+
+
+async def get_window_history(db, user_id: int, start: date, end: date):
+    """Window rows per day from start to end, days being UTC days as effective_from is stored."""
+    closed = end < datetime.utcnow().date()
+    key = (user_id, _generation(user_id), start, end)
+    if closed:
+        rows = _history_cache.get(key)
+        if rows is not None:
+            return rows
+
+    result = await db.execute(versions_overlapping(user_id, start, end))
+    rows = resolve_window_history(result.scalars().all(), start, end)
+
+    if closed:
+        _history_cache.set(key, rows)
+    return rows
+
+
+def invalidate_window_history(user_id: int):
+    _generations.set(user_id, next(_generation_ids))
@@ -0,0 +1,103 @@
+# window_index.py
+
+import os
+from bisect import bisect_right
+
+from sqlalchemy import func, select
+
+from cache import TTLCache
+from models import DrinkingWindow
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Per-user active-window intervals kept in memory, so classifying a drink needs no query.
+# The routes in routers/drinking_windows.py invalidate a user's entry on every change,
+# but only in the worker that made it: other workers keep classifying against the old
+# windows for up to WINDOW_CACHE_TTL_SECONDS. Keep it short when running several workers
+# (0 turns the cache off); a cache hit still saves a query on every drink logged.
+WINDOW_CACHE_TTL_SECONDS = float(os.getenv("WINDOW_CACHE_TTL_SECONDS", "30"))
+WINDOW_CACHE_MAX_USERS = int(os.getenv("WINDOW_CACHE_MAX_USERS", "10000"))
+
+_active_windows = TTLCache(maxsize=WINDOW_CACHE_MAX_USERS, ttl=WINDOW_CACHE_TTL_SECONDS)
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+
+class WindowIntervals:
+    """Sorted, non-overlapping time-of-day intervals covered by a user's active windows.
+
+    A window whose end_time is earlier than its start_time wraps past midnight
+    and is stored as two intervals. Lookups are a single bisect.
+    """
+
+    def __init__(self, windows=()):
+        intervals = []
+        for window in windows:
+            start, end = _seconds(window.start_time), _seconds(window.end_time)
+            if window.duration_hours is not None and window.duration_hours >= 24:
+                intervals.append((0, SECONDS_PER_DAY))
+            elif end < start:
+                intervals.append((start, SECONDS_PER_DAY))
+                intervals.append((0, end))
+            else:
+                intervals.append((start, end))
+
+        # Merge overlaps so each time of day falls into at most one interval
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+
+    def __bool__(self):
+        return bool(self._starts)
+
+    def contains(self, timestamp):
+        """Whether the time of day of `timestamp` falls inside an active window (bounds inclusive)."""
+        seconds = _seconds(timestamp.time())
+        i = bisect_right(self._starts, seconds) - 1
+        return i >= 0 and seconds <= self._ends[i]
+
+
+async def get_active_intervals(db, user_id):
+    intervals = _active_windows.get(user_id)
+    if intervals is None:
+        result = await db.execute(select(DrinkingWindow).where(
+            DrinkingWindow.user_id == user_id,
+            DrinkingWindow.is_active == True
+        ))
+        intervals = WindowIntervals(result.scalars().all())
+        _active_windows.set(user_id, intervals)
+    return intervals
+
+
+async def warm_active_windows(db, max_users):
+    """Preload the intervals of up to `max_users` users, most recently edited windows first.
+
+    Returns how many users were loaded.
+    """
+    recent_users = select(DrinkingWindow.user_id).where(
+        DrinkingWindow.is_active == True
+    ).group_by(DrinkingWindow.user_id).order_by(
+        func.max(DrinkingWindow.updated_at).desc()
+    ).limit(min(max_users, WINDOW_CACHE_MAX_USERS))
+    result = await db.execute(select(DrinkingWindow).where(
+        DrinkingWindow.user_id.in_(recent_users),
+        DrinkingWindow.is_active == True
+    ))
+    windows = {}
+    for window in result.scalars().all():
+        windows.setdefault(window.user_id, []).append(window)
+    for user_id, user_windows in windows.items():
+        _active_windows.set(user_id, WindowIntervals(user_windows))
+    return len(windows)
+
+
+def invalidate_active_windows(user_id):
+    """Forget a user's cached intervals; call after committing any window change."""
+    _active_windows.pop(user_id)